@@ -0,0 +1,183 @@
+# Incremental re-evaluation: using the `uses` lists
+#
+# Every node knows its parents, and through `uses` the nodes built on top of it.
+# When a single Variable changes, only the nodes downstream of it (its "cone")
+# can change value, so instead of rebuilding the graph we walk `uses` from the
+# Variable and recompute just those, in topological order. A node whose value
+# comes out the same stops the walk there.
+#
+# Gradients (reverse mode adjoints) are refreshed the same way, in the other
+# direction. A node's adjoint is the sum, over its uses, of the use's adjoint
+# times the use's partial derivative with respect to the node. That partial only
+# changes when the use's parents changed value (for Mul and Div), so only the
+# parents of such uses need their adjoint recomputed, and from there only the
+# parents of nodes whose adjoint actually changed.
+import heapq
+from overloading import Variable, Add, Sub, Mul, Div, lift
+
+def parents(node):
+  return getattr(node, "parents", ()) # Constants and Variables have none
+
+def evaluate(node):
+  a, b = node.parents
+  if isinstance(node, Add):
+    return a.value + b.value
+  elif isinstance(node, Sub):
+    return a.value - b.value
+  elif isinstance(node, Mul):
+    return a.value * b.value
+  else:
+    return a.value / b.value
+
+# Partial derivatives of NODE with respect to each of its two parents
+def local_partials(node):
+  a, b = node.parents
+  if isinstance(node, Add):
+    return (1.0, 1.0)
+  elif isinstance(node, Sub):
+    return (1.0, -1.0)
+  elif isinstance(node, Mul):
+    return (b.value, a.value)
+  else:
+    return (1.0 / b.value, -a.value / (b.value * b.value))
+
+class Incremental():
+  def __init__(self, result, *variables):
+    self.result = lift(result)
+    self.variables = variables
+    # Topological order of the result's graph; nodes outside of it are ignored
+    self.order = []
+    visited = set()
+    stack = [(self.result, False)]
+    while len(stack) != 0:
+      node, expanded = stack.pop()
+      if expanded:
+        self.order.append(node)
+      elif node not in visited:
+        visited.add(node)
+        stack.append((node, True))
+        for parent in reversed(parents(node)):
+          stack.append((parent, False))
+    self.position = { node: i for (i, node) in enumerate(self.order) }
+    self.recomputed = { "values": 0, "adjoints": 0 } # Work done by the last `set`
+
+    # Full reverse sweep, once
+    for node in self.order:
+      node.adjoint = 0.0
+    self.result.adjoint = 1.0
+    for node in reversed(self.order):
+      if len(parents(node)) != 0:
+        for (parent, partial) in zip(node.parents, local_partials(node)):
+          parent.adjoint += node.adjoint * partial
+
+  def uses(self, node):
+    # A node that uses another twice (x * x) appears twice in its `uses`
+    return [ use for use in dict.fromkeys(node.uses) if use in self.position ]
+
+  def adjoint(self, node):
+    total = 0.0
+    for use in self.uses(node):
+      for (parent, partial) in zip(use.parents, local_partials(use)):
+        if parent is node:
+          total += use.adjoint * partial
+    return total
+
+  # Set VARIABLE to VALUE, and bring every value and adjoint in the graph up to date.
+  def set(self, variable, value: float):
+    self.recomputed = { "values": 0, "adjoints": 0 }
+    if variable.value == value:
+      return
+    variable.value = value
+
+    # Forward, in topological order (a min-heap on position), through the cone
+    changed = [variable]
+    pending = [ (self.position[use], use) for use in self.uses(variable) ]
+    heapq.heapify(pending)
+    queued = { use for (_, use) in pending }
+    while len(pending) != 0:
+      _, node = heapq.heappop(pending)
+      value = evaluate(node)
+      self.recomputed["values"] += 1
+      if value == node.value:
+        continue # Same value: nothing further down can change through here
+      node.value = value
+      changed.append(node)
+      for use in self.uses(node):
+        if use not in queued:
+          queued.add(use)
+          heapq.heappush(pending, (self.position[use], use))
+
+    # Backward, in reverse topological order (a max-heap on position): parents of
+    # Mul and Div nodes whose inputs changed have a changed partial derivative
+    stale = set()
+    for node in changed:
+      for use in self.uses(node):
+        if isinstance(use, (Mul, Div)):
+          stale.update(use.parents)
+    pending = [ (-self.position[node], node) for node in stale if node is not self.result ]
+    heapq.heapify(pending)
+    queued = { node for (_, node) in pending }
+    while len(pending) != 0:
+      _, node = heapq.heappop(pending)
+      adjoint = self.adjoint(node)
+      self.recomputed["adjoints"] += 1
+      if adjoint == node.adjoint:
+        continue
+      node.adjoint = adjoint
+      for parent in parents(node):
+        if parent not in queued:
+          queued.add(parent)
+          heapq.heappush(pending, (-self.position[parent], parent))
+
+  def value(self):
+    return self.result.value
+
+  def gradient(self):
+    return [ getattr(v, "adjoint", 0.0) if v in self.position else 0.0 for v in self.variables ]
+
+def foo(x, y):
+  return (x * x) + (y - x) + 2
+
+def main():
+  x = Variable("x", 10)
+  y = Variable("y", 20)
+  # result = x^2 + (y-x) + 2
+  graph = Incremental(foo(x, y), x, y)
+  print("value:", graph.value(), "gradient:", graph.gradient())
+  graph.set(x, 5)
+  print("value:", graph.value(), "gradient:", graph.gradient(), "recomputed:", graph.recomputed)
+
+  # A model over hundreds of inputs, each term touching two neighbors
+  n = 300
+  xs = [ Variable(f"x_{i}", i / n) for i in range(n) ]
+  def model(xs):
+    terms = []
+    for i in range(n - 1):
+      d = xs[i + 1] - xs[i] * xs[i]
+      terms.append(d * d)
+    return terms
+  def pairwise(terms):
+    while len(terms) > 1:
+      terms = [ terms[i] + terms[i + 1] if i + 1 < len(terms) else terms[i] for i in range(0, len(terms), 2) ]
+    return terms[0]
+  terms = model(xs)
+  # A running total puts every later partial sum downstream of each term...
+  total = terms[0]
+  for term in terms[1:]:
+    total = total + term
+  graph = Incremental(total, *xs)
+  graph.set(xs[150], 0.25)
+  print(f"running total: {len(graph.order)} nodes, recomputed after changing one input: {graph.recomputed}")
+
+  # ...while summing pairwise keeps each term's cone to about log2(n) additions
+  graph = Incremental(pairwise(terms), *xs)
+  graph.set(xs[150], 0.5)
+  print(f"pairwise sum: {len(graph.order)} nodes, recomputed after changing one input: {graph.recomputed}")
+
+  # Same as building the graph from scratch, on new variables (the adjoints live on the nodes)?
+  ys = [ Variable(f"y_{i}", x.value) for (i, x) in enumerate(xs) ]
+  fresh = Incremental(pairwise(model(ys)), *ys)
+  print("value and gradient match a full sweep:", graph.value() == fresh.value() and graph.gradient() == fresh.gradient())
+
+if __name__ == "__main__":
+  main()
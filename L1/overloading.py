@@ -84,4 +84,5 @@ def main():
   print(result.parents) # Add, Constant
   print(result.parents[0].uses) # Result
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,52 @@
+# Run the benchmarks from the L2 directory:
+#
+#   python -m benchmarks --output results.json
+#   python -m benchmarks --baseline results.json   # flag regressions against a saved run
+import argparse
+import sys
+from benchmarks.harness import measure, measure_once, peak_memory, save, load, compare, report
+from benchmarks.cases import cases
+
+def main():
+  parser = argparse.ArgumentParser(prog = "python -m benchmarks")
+  parser.add_argument("--output", help = "write results to this JSON file")
+  parser.add_argument("--baseline", help = "compare against results saved in this JSON file")
+  parser.add_argument("--threshold", type = float, default = 0.2, help = "slowdown that counts as a regression (0.2 = 20%%)")
+  parser.add_argument("--repeat", type = int, default = 5, help = "timed repetitions per benchmark")
+  parser.add_argument("--filter", default = "", help = "only run benchmarks whose name contains this")
+  parser.add_argument("--quick", action = "store_true", help = "smaller sweeps")
+  parser.add_argument("--no-jax", action = "store_true", help = "skip the JAX benchmarks")
+  args = parser.parse_args()
+
+  jax = not args.no_jax
+  if jax:
+    try:
+      import jax
+    except ImportError:
+      print("jax is not installed, skipping the JAX benchmarks")
+      jax = False
+
+  results = {}
+  for (name, params, fn, cold) in cases(args.quick, jax):
+    if args.filter not in name:
+      continue
+    time = measure_once(fn) if cold else measure(fn, args.repeat)
+    results[name] = {
+      "params": params,
+      "time": time,
+      "peak_bytes": None if cold else peak_memory(fn),
+    }
+    memory = "" if cold else f"  peak {results[name]['peak_bytes'] / 1024:10.1f}KiB"
+    print(f"{name:<45} median {time['median'] * 1e3:10.3f}ms  ±{time['stdev'] * 1e3:8.3f}ms{memory}", flush = True)
+
+  if args.output:
+    save(args.output, results)
+  if args.baseline:
+    rows = compare(results, load(args.baseline), args.threshold)
+    print(f"\n -- Compared to {args.baseline} -- ")
+    report(rows)
+    if any(row[-1] for row in rows):
+      sys.exit(1)
+
+if __name__ == "__main__":
+  main()
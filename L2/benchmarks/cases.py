@@ -0,0 +1,155 @@
+# The workloads we benchmark
+#
+# Each case is (name, params, fn, cold): `fn` is the thing being timed, and
+# `cold` marks one-shot measurements such as a jit's first (compiling) call.
+import random
+import numpy as np
+import forward
+import reverse
+import tape
+import codegen
+import tracing
+import optimization
+import opt_scipy
+from objectives import distance_to_line, linear_regression
+
+# Synthetic regression data: N points near a line, so graph size grows with N.
+def regression(n_points: int):
+  generator = random.Random(0)
+  points = []
+  for _ in range(n_points):
+    x = generator.uniform(0, 50)
+    points.append((x, 0.25 * x + 2 + generator.uniform(-1, 1)))
+  def objective(args):
+    total = 0
+    for point in points:
+      total += distance_to_line(args, point)
+    return total
+  return objective
+
+# The Rosenbrock function of N inputs, so input dimension grows with N.
+def rosenbrock(n: int):
+  def objective(args):
+    total = 0
+    for i in range(n - 1):
+      d = args[i + 1] - args[i] * args[i]
+      e = 1 - args[i]
+      total += 100 * d * d + e * e
+    return total
+  return objective
+
+# Least squares on an N x N linear system, written with tensor nodes: one node per
+# matrix operation rather than N^2 scalar multiplies.
+def least_squares(n: int):
+  generator = np.random.default_rng(0)
+  A = generator.normal(size = (n, n))
+  y = generator.normal(size = n)
+  def objective(x):
+    r = A @ x - y
+    return r.dot(r)
+  return objective
+
+def variables(engine, x):
+  return [ engine.Variable(f"x_{i}", p) for (i, p) in enumerate(x) ]
+
+# The tape engine records onto the current tape: give every construction run a
+# fresh one, so that the nodes built do not pile up on the process-wide tape.
+def fresh_tape(engine, run):
+  if engine is not tape:
+    return run
+  def on_fresh_tape():
+    with tape.Tape():
+      return run()
+  return on_fresh_tape
+
+def construction(engine, f, x):
+  return fresh_tape(engine, lambda: f(variables(engine, x)))
+
+def forward_gradient(f, x):
+  def run():
+    inputs = variables(forward, x)
+    return forward.forward_gradient(f(inputs), *inputs)
+  return run
+
+def vector_gradient(f, x):
+  def run():
+    inputs = variables(forward, x)
+    return forward.vector_gradient(f(inputs), *inputs)
+  return run
+
+def reverse_gradient(engine, f, x):
+  def run():
+    inputs = variables(engine, x)
+    return engine.reverse_gradient(f(inputs), *inputs)
+  return run # On the default tape, as callers would: the sweep starts at the inputs
+
+def tensor_gradient(engine, f, x):
+  def run():
+    input = engine.Variable("x", x)
+    result = f(input)
+    return forward.tensor_gradient(result, input) if engine is forward else reverse.reverse_gradient(result, input)
+  return run
+
+def replayed(objective, x):
+  objective.value_and_grad(x) # Trace (or generate code) outside of the timings
+  return lambda: objective.value_and_grad(x)
+
+def cases(quick: bool = False, jax: bool = True):
+  sizes = [10, 100] if quick else [10, 100, 1000]
+  dimensions = [2, 8] if quick else [2, 8, 32, 128]
+  line = [1.0, -4.0, 8.0]
+
+  for n in sizes:
+    f = regression(n)
+    params = { "points": n }
+    yield (f"construction/forward[points={n}]", params, construction(forward, f, line), False)
+    yield (f"construction/reverse[points={n}]", params, construction(reverse, f, line), False)
+    yield (f"construction/tape[points={n}]", params, construction(tape, f, line), False)
+    yield (f"reverse_gradient/reverse[points={n}]", params, reverse_gradient(reverse, f, line), False)
+    yield (f"reverse_gradient/tape[points={n}]", params, reverse_gradient(tape, f, line), False)
+    yield (f"forward_gradient/vector[points={n}]", params, vector_gradient(f, line), False)
+    yield (f"value_and_grad/tracing[points={n}]", params, replayed(tracing.compile(f, 3), line), False)
+    yield (f"value_and_grad/flattened[points={n}]", params, replayed(tracing.compile(f, 3, simplify = True), line), False)
+
+  for n in dimensions:
+    f = rosenbrock(n)
+    x = [ -1.0 + 0.1 * i for i in range(n) ]
+    params = { "inputs": n }
+    yield (f"forward_gradient/scalar[inputs={n}]", params, forward_gradient(f, x), False)
+    yield (f"forward_gradient/vector[inputs={n}]", params, vector_gradient(f, x), False)
+    yield (f"reverse_gradient/reverse[inputs={n}]", params, reverse_gradient(reverse, f, x), False)
+    yield (f"reverse_gradient/tape[inputs={n}]", params, reverse_gradient(tape, f, x), False)
+    yield (f"value_and_grad/tracing[inputs={n}]", params, replayed(tracing.compile(f, n), x), False)
+    yield (f"value_and_grad/codegen[inputs={n}]", params, replayed(codegen.Jitted(f, n), x), False)
+
+  for n in [16, 128]:
+    f = least_squares(n)
+    x = np.linspace(-1, 1, n)
+    params = { "n": n }
+    yield (f"tensor_gradient/forward[n={n}]", params, tensor_gradient(forward, f, x), False)
+    yield (f"tensor_gradient/reverse[n={n}]", params, tensor_gradient(reverse, f, x), False)
+
+  for method in ["gradient-descent", "newton-cg", "lbfgs"]:
+    yield (f"optimize/{method}", { "method": method },
+           lambda method = method: optimization.optimize(linear_regression, [1, 1, 0], method = method), False)
+  yield ("opt_scipy/SLSQP", {}, lambda: opt_scipy.call_scipy(linear_regression, [1, 1, 0]), False)
+
+  if jax:
+    yield from jax_cases(dimensions)
+
+# JAX: compile time (the first call of a fresh jit) is measured apart from steady state.
+def jax_cases(dimensions):
+  import jax
+  import jax.numpy as jnp
+  import opt_jax
+
+  for n in dimensions:
+    f = rosenbrock(n)
+    x = jnp.array([ -1.0 + 0.1 * i for i in range(n) ])
+    params = { "inputs": n }
+    fresh = lambda f = f: jax.jit(jax.value_and_grad(f))
+    yield (f"jax/compile[inputs={n}]", params, lambda fresh = fresh, x = x: jax.block_until_ready(fresh()(x)), True)
+    compiled = fresh()
+    yield (f"jax/steady[inputs={n}]", params, lambda compiled = compiled, x = x: jax.block_until_ready(compiled(x)), False)
+
+  yield ("opt_jax/SLSQP", {}, lambda: opt_jax.call_scipy(linear_regression, [1.0, 1.0, 0.0]), False)
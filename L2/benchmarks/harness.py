@@ -0,0 +1,83 @@
+# Timing, memory and comparison helpers for the benchmarks
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import tracemalloc
+from timeit import default_timer as timer
+
+# Time FN: `warmup` untimed calls first, then `repeat` timed ones. Anything the
+# code under test prints is swallowed, so it does not pollute the timings.
+def measure(fn, repeat: int = 5, warmup: int = 1):
+  with contextlib.redirect_stdout(io.StringIO()):
+    for _ in range(warmup):
+      fn()
+    times = []
+    for _ in range(repeat):
+      start = timer()
+      fn()
+      times.append(timer() - start)
+  return {
+    "min": min(times),
+    "median": statistics.median(times),
+    "mean": statistics.mean(times),
+    "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    "repeat": repeat,
+  }
+
+# Time a single cold call, e.g. a `jit`-ed function's first call, which includes compiling it.
+def measure_once(fn):
+  with contextlib.redirect_stdout(io.StringIO()):
+    start = timer()
+    fn()
+    elapsed = timer() - start
+  return { "min": elapsed, "median": elapsed, "mean": elapsed, "stdev": 0.0, "repeat": 1 }
+
+# Peak memory allocated by Python while running FN once (tracemalloc slows code
+# down, so this is a separate run from the timed ones).
+def peak_memory(fn):
+  with contextlib.redirect_stdout(io.StringIO()):
+    tracemalloc.start()
+    try:
+      fn()
+      _, peak = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+  return peak
+
+def environment():
+  versions = { "python": platform.python_version(), "platform": platform.platform() }
+  for name in ["numpy", "scipy", "jax"]:
+    module = sys.modules.get(name)
+    if module is not None:
+      versions[name] = module.__version__
+  return versions
+
+def save(path, results):
+  with open(path, "w") as file:
+    json.dump({ "environment": environment(), "results": results }, file, indent = 2, sort_keys = True)
+
+def load(path):
+  with open(path) as file:
+    return json.load(file)["results"]
+
+# Compare median times against a baseline. A benchmark regresses when it got
+# slower by more than `threshold` (a fraction: 0.2 is 20%).
+def compare(results, baseline, threshold: float = 0.2):
+  rows = []
+  for name in sorted(results):
+    if name not in baseline:
+      continue
+    before = baseline[name]["time"]["median"]
+    after = results[name]["time"]["median"]
+    ratio = after / before if before > 0 else float("inf")
+    rows.append((name, before, after, ratio, ratio > 1 + threshold))
+  return rows
+
+def report(rows):
+  width = max((len(row[0]) for row in rows), default = 10)
+  for (name, before, after, ratio, regressed) in rows:
+    flag = "  REGRESSION" if regressed else ""
+    print(f"{name:<{width}}  {before * 1e3:10.3f}ms -> {after * 1e3:10.3f}ms  ({ratio:5.2f}x){flag}")
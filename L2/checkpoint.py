@@ -0,0 +1,99 @@
+# Gradient checkpointing for reverse mode
+#
+# `reverse_gradient` needs every intermediate value alive until the backward
+# pass, so memory grows with the length of the computation. A Checkpoint node
+# instead runs a segment of the computation on fresh Variables and keeps only
+# the segment's (scalar) output, letting the rest of its graph be freed. When
+# the backward pass reaches the checkpoint, it rebuilds the segment from its
+# inputs' values, back-propagates through it, and drops it again. Peak memory
+# is then one segment plus the checkpoints, for the price of running every
+# segment twice.
+import math
+from reverse import Diff, Variable, lift, order_nodes, reverse_gradient
+
+# Build through `checkpoint`, which lifts numbers first: parents must be older
+# than their child, as `order_nodes` sorts by creation.
+class Checkpoint(Diff):
+  def __init__(self, f, *args):
+    for arg in args:
+      if not isinstance(arg, Diff):
+        raise TypeError(f"Checkpoint takes nodes, got {type(arg).__name__}: use checkpoint()")
+    self.f = f
+    self.parents = list(args)
+    self.adjoint = 0.0
+    result, _ = self.run()
+    self.value = result.value
+
+  # (Re)build the segment's graph from the current values of our parents
+  def run(self):
+    inputs = [ Variable(f"c_{i}", parent.value) for (i, parent) in enumerate(self.parents) ]
+    return lift(self.f(*inputs)), inputs
+
+  def d(self):
+    result, inputs = self.run()
+    gradient = reverse_gradient(result, *inputs)
+    for (parent, g) in zip(self.parents, gradient):
+      parent.adjoint += self.adjoint * g
+
+# F(*ARGS) (nodes or numbers) as one checkpointed node.
+def checkpoint(f, *args):
+  return Checkpoint(f, *(lift(arg) for arg in args))
+
+# How many nodes one term f(args, item) adds to the graph
+def nodes_per_item(f, args, item):
+  inputs = [ Variable(f"c_{i}", lift(arg).value) for (i, arg) in enumerate(args) ]
+  return len(order_nodes(lift(f(inputs, item))))
+
+# Sum f(args, item) over a sequence of ITEMS (e.g. data points), in checkpointed
+# segments. By default a segment holds √n items, so that both the number of
+# checkpoints and the size of the one segment alive during the backward pass grow
+# as √n. With `memory_budget` (in graph nodes) segments are as long as the budget
+# allows instead.
+def checkpointed_sum(f, args, items, segment_size=None, memory_budget=None):
+  n = len(items)
+  if segment_size is None:
+    if memory_budget is not None:
+      segment_size = max(1, memory_budget // nodes_per_item(f, args, items[0]))
+    else:
+      segment_size = max(1, math.ceil(math.sqrt(n)))
+
+  def segment(start, stop):
+    def g(*args):
+      total = 0
+      for item in items[start:stop]:
+        total = total + f(args, item)
+      return total
+    return g
+
+  total = 0
+  for start in range(0, n, segment_size):
+    total = total + checkpoint(segment(start, min(start + segment_size, n)), *args)
+  return total
+
+def main():
+  import random
+  import tracemalloc
+  from objectives import distance_to_line
+
+  random.seed(0)
+  points = [ (x, 0.25 * x + 2 + random.uniform(-1, 1)) for x in (random.uniform(0, 50) for _ in range(5000)) ]
+  def plain(args):
+    total = 0
+    for point in points:
+      total = total + distance_to_line(args, point)
+    return total
+
+  for (name, objective) in [("plain", plain), ("checkpointed", lambda args: checkpointed_sum(distance_to_line, args, points))]:
+    tracemalloc.start()
+    args = [ Variable(f"x_{i}", p) for (i, p) in enumerate([1, -4, 8]) ]
+    gradient = reverse_gradient(objective(args), *args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name}: gradient = {gradient}, peak memory = {peak / 2**20:.1f}MiB")
+
+  # Numbers among the arguments are lifted before the checkpoint is built
+  x = Variable("x", 2.0)
+  print("d/dx checkpoint(a * b, x, 3.0):", reverse_gradient(checkpoint(lambda a, b: a * b, x, 3.0), x))
+
+if __name__ == "__main__":
+  main()
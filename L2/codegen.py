@@ -0,0 +1,162 @@
+# Generating Python source from traced graphs: a tiny JIT for our own AD
+#
+# Interpreting a graph costs a method call and a handful of attribute lookups per
+# node, on every sweep. Once a graph is traced, though, we can write it out as a
+# straight-line Python function that computes the value and then the full
+# reverse-mode gradient using nothing but local variables, and let `compile`
+# and `exec` turn it into bytecode once.
+import math
+import passes
+from forward import Constant, Variable, Add, Sub, Mul, Div, lift, order_nodes
+
+OPERATORS = { Add: "+", Sub: "-", Mul: "*", Div: "/" }
+
+# Emit the source of `def name(x): ...` returning (value, gradient) for RESULT
+# with respect to INPUTS. Returns the source and the globals it needs.
+def generate(result, inputs, name="generated"):
+  order = order_nodes(result)
+  names = {} # node -> expression naming its value
+  tracked = set(inputs) # nodes that get an adjoint
+  constants = {} # globals for constants that have no literal form
+  forward = []
+  for (i, input) in enumerate(inputs):
+    names[input] = f"x{i}"
+  for node in order:
+    if node in names:
+      continue
+    if isinstance(node, (Constant, Variable)):
+      # Leaves that are not inputs are baked in as constants
+      value = float(node.value)
+      if math.isfinite(value):
+        names[node] = repr(value)
+      else:
+        names[node] = f"c{len(constants)}"
+        constants[names[node]] = value
+    elif type(node) in OPERATORS:
+      a, b = node.parents
+      names[node] = f"v{len(forward)}"
+      tracked.add(node)
+      forward.append(f"  {names[node]} = {names[a]} {OPERATORS[type(node)]} {names[b]}")
+    else:
+      raise TypeError(f"cannot generate code for {type(node).__name__} nodes")
+
+  # Reverse sweep: the first contribution to an adjoint assigns it, later ones accumulate.
+  adjoints = {}
+  backward = []
+  def accumulate(node, expression):
+    if node not in tracked:
+      return # Constants need no adjoint
+    if node in adjoints:
+      backward.append(f"  {adjoints[node]} += {expression}")
+    else:
+      adjoints[node] = "g" + names[node]
+      backward.append(f"  {adjoints[node]} = {expression}")
+
+  root = names[result]
+  if result in tracked:
+    adjoints[result] = "g" + root
+    backward.append(f"  {adjoints[result]} = 1.0")
+  for node in reversed(order):
+    if type(node) not in OPERATORS or node not in adjoints:
+      continue
+    g = adjoints[node]
+    a, b = node.parents
+    va, vb = names[a], names[b]
+    if isinstance(node, Add):
+      accumulate(a, g)
+      accumulate(b, g)
+    elif isinstance(node, Sub):
+      accumulate(a, g)
+      accumulate(b, f"-{g}")
+    elif isinstance(node, Mul):
+      accumulate(a, f"{g} * {vb}")
+      accumulate(b, f"{va} * {g}")
+    else:
+      accumulate(a, f"{g} / {vb}")
+      accumulate(b, f"-({va} * {g} / ({vb} * {vb}))")
+
+  gradient = ", ".join(adjoints.get(input, "0.0") for input in inputs)
+  unpack = [f"  {', '.join(names[input] for input in inputs)}, = x"] if inputs else []
+  source = "\n".join(
+    [f"def {name}(x):"] + unpack + forward + backward + [f"  return {root}, [{gradient}]"]
+  ) + "\n"
+  value_source = "\n".join(
+    [f"def {name}_value(x):"] + unpack + forward + [f"  return {root}"]
+  ) + "\n"
+  return source + "\n" + value_source, constants
+
+# Turn the generated source into callables.
+def build(result, inputs, name="generated"):
+  source, constants = generate(result, inputs, name)
+  namespace = dict(constants)
+  exec(compile(source, f"<codegen {name}>", "exec"), namespace)
+  return namespace[name], namespace[f"{name}_value"], source
+
+class Jitted():
+  def __init__(self, f, n_inputs: int, simplify: bool = False):
+    self.f = f
+    self.n_inputs = n_inputs
+    self.simplify = simplify
+    self.stats = None
+    self.value_and_grad_code = None # Generated at the first point we are called with
+
+  def generate(self, x):
+    inputs = [ Variable(f"x_{i}", float(v)) for (i, v) in enumerate(x) ]
+    result = lift(self.f(inputs))
+    if self.simplify:
+      result, self.stats = passes.optimize(result, fuse = False) # We only generate binary ops
+    name = getattr(self.f, "__name__", "generated")
+    if not name.isidentifier():
+      name = "generated" # e.g. lambdas
+    self.value_and_grad_code, self.value_code, self.source = build(result, inputs, name)
+
+  def check(self, x):
+    if len(x) != self.n_inputs:
+      raise ValueError(f"expected {self.n_inputs} inputs, got {len(x)}")
+    if self.value_and_grad_code is None:
+      self.generate(x)
+
+  def eval(self, x):
+    self.check(x)
+    return float(self.value_code(x))
+
+  def value_and_grad(self, x):
+    self.check(x)
+    return self.value_and_grad_code(x)
+
+  def grad(self, x):
+    return self.value_and_grad(x)[1]
+
+  __call__ = eval
+
+# Generated code is cached per (function, arity), so repeat calls skip codegen.
+cache = {}
+
+def jit(f, n_inputs: int, simplify: bool = False):
+  key = (f, n_inputs, simplify)
+  if key not in cache:
+    cache[key] = Jitted(f, n_inputs, simplify)
+  return cache[key]
+
+def main():
+  from timeit import timeit
+  from tracing import compile as trace
+  from objectives import linear_regression
+
+  objective = jit(linear_regression, 3)
+  print("value_and_grad(1, 1, 0):", objective.value_and_grad([1, 1, 0]))
+  print("value_and_grad(2, 1, 0):", objective.value_and_grad([2, 1, 0]))
+  print("cached:", jit(linear_regression, 3) is objective)
+  print("generated lines:", len(objective.source.splitlines()))
+  simplified = jit(linear_regression, 3, simplify = True)
+  simplified.eval([1, 1, 0])
+  print("generated lines (simplified):", len(simplified.source.splitlines()), dict(simplified.stats))
+
+  interpreted = trace(linear_regression, 3)
+  runs = 10000
+  us = lambda seconds: f"{seconds / runs * 1e6:.2f}us"
+  print("interpreted:", us(timeit(lambda: interpreted.value_and_grad([1, 1, 0]), number = runs)))
+  print("generated:", us(timeit(lambda: objective.value_and_grad([1, 1, 0]), number = runs)))
+
+if __name__ == "__main__":
+  main()
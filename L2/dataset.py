@@ -0,0 +1,139 @@
+# Objectives over large datasets
+#
+# `objectives.linear_regression` sums a loss over four points written into the
+# code, building one graph node per point and operation. With millions of
+# observations on disk, neither the data nor that graph fit in memory. Instead,
+# we memory-map the file and read it a chunk of rows at a time. Each chunk's
+# columns go through the per-point loss as whole arrays (see the batched values
+# in forward.py and reverse.py), so a chunk costs one small graph, whatever its
+# size, and its gradient is added to a running sum. Memory is bounded by the
+# chunk size, not by the size of the dataset.
+import os
+import numpy as np
+import forward
+import reverse
+from collections import Counter
+
+# Rows of observations stored on disk: either a `.npy` file holding a 2D array,
+# or a raw binary file of `dtype` values with `columns` values per row.
+class Dataset():
+  def __init__(self, path: str, columns: int = None, dtype = np.float64):
+    if path.endswith(".npy"):
+      self.data = np.load(path, mmap_mode = "r")
+    else:
+      if columns is None:
+        raise ValueError("raw binary datasets need the number of columns")
+      if os.path.getsize(path) == 0:
+        raise ValueError(f"no rows of observations in {path}") # NumPy cannot map an empty file
+      self.data = np.memmap(path, dtype = dtype, mode = "r").reshape(-1, columns)
+    if self.data.ndim != 2:
+      raise ValueError(f"expected rows of observations, got an array of shape {self.data.shape}")
+    if self.data.shape[0] == 0:
+      raise ValueError(f"no rows of observations in {path}") # The mean loss would be 0 / 0
+
+  def __len__(self):
+    return self.data.shape[0]
+
+  # Consecutive blocks of at most `chunk_size` rows, read into memory one at a time.
+  def chunks(self, chunk_size: int):
+    for start in range(0, len(self), chunk_size):
+      yield np.asarray(self.data[start:start + chunk_size], dtype = float)
+
+  # `size` rows drawn at random (with replacement), read in file order.
+  def sample(self, size: int, generator):
+    rows = np.sort(generator.integers(0, len(self), size))
+    return np.asarray(self.data[rows], dtype = float)
+
+# The mean of LOSS(parameters, point) over every row of DATASET, where a point is
+# the list of the row's values. Since the columns of a chunk are passed as arrays,
+# LOSS must only combine them elementwise, as objectives.distance_to_line does.
+# `engine` is the forward or reverse module: which mode computes the gradients.
+class DatasetObjective():
+  def __init__(self, loss, dataset: Dataset, chunk_size: int = 65536, engine = reverse, seed: int = 0):
+    if engine not in (forward, reverse):
+      raise ValueError("engine must be the forward or reverse module")
+    self.loss = loss
+    self.dataset = dataset
+    self.chunk_size = chunk_size
+    self.engine = engine
+    self.generator = np.random.default_rng(seed)
+    self.evaluations = Counter()
+
+  def columns(self, rows):
+    return [ rows[:, j] for j in range(rows.shape[1]) ]
+
+  # Sum of the loss over ROWS, and its gradient: one graph, one sweep.
+  def chunk_value_and_grad(self, x, rows):
+    inputs = [ self.engine.Variable(f"x_{i}", float(v)) for (i, v) in enumerate(x) ]
+    result = self.engine.lift(self.loss(inputs, self.columns(rows)))
+    if self.engine is forward:
+      gradient = forward.tensor_gradient(result, *inputs)
+    else:
+      gradient = reverse.reverse_gradient(result, *inputs)
+    return float(np.sum(result.value)), np.array(gradient, dtype = float)
+
+  # Over the whole dataset, or over ROWS only (e.g. a minibatch from `sample`).
+  def value_and_grad(self, x, rows=None):
+    self.evaluations["value_and_grad" if rows is None else "minibatch"] += 1
+    if rows is not None:
+      value, gradient = self.chunk_value_and_grad(x, rows)
+      return value / len(rows), gradient / len(rows)
+    value, gradient = 0.0, np.zeros(len(x))
+    for chunk in self.dataset.chunks(self.chunk_size):
+      chunk_value, chunk_gradient = self.chunk_value_and_grad(x, chunk)
+      value += chunk_value
+      gradient += chunk_gradient
+    return value / len(self.dataset), gradient / len(self.dataset)
+
+  def grad(self, x, rows=None):
+    return self.value_and_grad(x, rows)[1]
+
+  # The value alone needs no graph: plain floats and arrays go straight through the loss.
+  def eval(self, x):
+    self.evaluations["value"] += 1
+    parameters = [ float(v) for v in x ]
+    total = 0.0
+    for chunk in self.dataset.chunks(self.chunk_size):
+      total += float(np.sum(self.loss(parameters, self.columns(chunk))))
+    return total / len(self.dataset)
+
+  # A random minibatch of rows, for stochastic gradient descent.
+  def sample(self, batch_size: int):
+    return self.dataset.sample(batch_size, self.generator)
+
+  __call__ = eval
+
+def main():
+  import tempfile
+  from objectives import distance_to_line
+  from optimization import optimize
+
+  # A million noisy points near y = 0.25x + 2, written to disk. The x are centered
+  # around 0, as plain SGD converges slowly on badly conditioned problems.
+  generator = np.random.default_rng(0)
+  x = generator.uniform(-5, 5, 1000000)
+  points = np.stack([x, 0.25 * x + 2 + generator.uniform(-1, 1, x.shape)], axis = 1)
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "points.npy")
+    np.save(path, points)
+    del points
+
+    dataset = Dataset(path)
+    for engine in [forward, reverse]:
+      objective = DatasetObjective(distance_to_line, dataset, engine = engine)
+      value, gradient = objective.value_and_grad([1, -4, 8])
+      print(f"{engine.__name__}: mean loss = {value:.4f}, gradient = {gradient.tolist()}")
+
+    print("\n -- Full batch (L-BFGS) -- ")
+    objective = DatasetObjective(distance_to_line, dataset)
+    a, b, c = optimize(objective, [1, 1, 0], method = "lbfgs")
+    print(f"y = {-a/b:.3f}x + {-c/b:.3f}")
+
+    print("\n -- Minibatches (SGD) -- ")
+    objective = DatasetObjective(distance_to_line, dataset)
+    a, b, c = optimize(objective, [1, 1, 0], method = "sgd", batch_size = 1024)
+    print(f"y = {-a/b:.3f}x + {-c/b:.3f}")
+    del dataset, objective # Release the memory map before the file goes away
+
+if __name__ == "__main__":
+  main()
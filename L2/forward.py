@@ -1,60 +1,197 @@
 # Forward mode Autodiff
+import itertools
+import numpy as np
+from operator import attrgetter
 
 def lift(value): 
   if isinstance(value, Diff):
     return value # Already a node 
+  elif intern_table is not None and isinstance(value, (int, float)):
+    return make(Constant, value)
   else:
     return Constant(value) # Make constant
+
+# Structural interning ("hash-consing"), opt-in: inside a `with interning():` block,
+# building the same operation on the same parents returns the node built the first
+# time, so identical subexpressions collapse into one shared node. The table holds
+# on to every node it returns, so the parent identities in its keys stay valid.
+intern_table = None
+
+class interning():
+  def __enter__(self):
+    global intern_table
+    self.previous = intern_table
+    intern_table = {}
+    return self
+
+  def __exit__(self, *exc):
+    global intern_table
+    intern_table = self.previous
+
+def make(op, *args):
+  if intern_table is None:
+    return op(*args)
+  if op is Constant:
+    key = (op, repr(args[0])) # repr keeps 1 / 1.0 and 0.0 / -0.0 apart
+  else:
+    key = structural_key(op, tuple(id(arg) for arg in args))
+  node = intern_table.get(key)
+  if node is None:
+    node = intern_table[key] = op(*args)
+  return node
+
+# What identifies an operation on parents with identities IDS, for interning (and
+# passes.cse): the parents of a commutative op may come in any order, and those
+# of a Dot in any order of pairs, each of which may be swapped.
+def structural_key(op, ids):
+  if op is Dot:
+    half = len(ids) // 2
+    return (op,) + tuple(sorted(tuple(sorted(pair)) for pair in zip(ids[:half], ids[half:])))
+  if op.commutative:
+    return (op,) + tuple(sorted(ids))
+  return (op,) + ids
   
-# Ancilliary: node ordering requires a topological-sort,
-# which we accomplish using a depth-first search.
+# Ancilliary: node ordering requires a topological-sort. Every node is created
+# after its parents, so the nodes reachable from the result, sorted by creation
+# number, already are one: we only need to find them, marking each node with
+# the number of the search that reached it rather than keeping a visited set.
+creation = itertools.count(1)
+searches = itertools.count(1)
+
+# Orders are cached on the result node; they stay valid for as long as no
+# node's `parents` is modified, as new nodes never change what lies above an
+# existing one. Call `invalidate_orders()` after rewiring a graph in place.
+graph_version = 0
+
+def invalidate_orders():
+  global graph_version
+  graph_version += 1
+
 def order_nodes(node): 
-  order = []
-  permanent = set()
-  temporary = set()
-
-  # Internal DFS visitor function
-  stack = []
-
-  def visit(rootNode):
-    stack.append(rootNode)
-
-    while len(stack) != 0:
-      node = stack.pop()
-      if node in permanent:
-        continue
-      if node in temporary:
-        temporary.remove(node)
-        permanent.add(node)
-        order.append(node)
-      else:
-        stack.append(node)
-        temporary.add(node)
-        
-        # Visit A before B, purely for legibility
-        for parent in reversed(node.parents): 
-          stack.append(parent)
-
-  visit(node)
-  # print(order)
+  if node.order_version == graph_version:
+    return node.order
+  mark = next(searches)
+  reached = [node]
+  node.mark = mark
+  for n in reached: # Grows as we go
+    for parent in n.parents:
+      if parent.mark != mark:
+        parent.mark = mark
+        reached.append(parent)
+
+  # Place nodes directly by creation number when they were created close
+  # together (the common case), and fall back to sorting otherwise.
+  lowest = min(n.serial for n in reached)
+  span = node.serial - lowest + 1
+  if span <= 4 * len(reached):
+    slots = [None] * span
+    for n in reached:
+      slots[n.serial - lowest] = n
+    order = [ n for n in slots if n is not None ]
+  else:
+    order = sorted(reached, key = attrgetter("serial"))
+
+  node.order = order
+  node.order_version = graph_version
   return order
 
+# Tensors: a Variable may hold a NumPy array, and a single node then covers a
+# whole array operation (see MatMul, Sum and Dot below) rather than one scalar
+# Mul or Add per element. Tangents for array-valued nodes carry a leading axis,
+# one row per input element being differentiated (see `tensor_gradient`).
+def shape(value):
+  return getattr(value, "shape", ()) # Plain floats have no shape
+
+def ndim(value):
+  return getattr(value, "ndim", 0)
+
+# When the operands of an elementwise op broadcast, a lower-rank operand's tangent
+# needs padding after its leading axis, so that the axis stays aligned.
+def tangent(node, out):
+  partial = node.partial
+  pad = ndim(out.value) - ndim(node.value)
+  if pad == 0 or ndim(partial) != ndim(node.value) + 1:
+    return partial
+  return partial.reshape(partial.shape[:1] + (1,) * pad + partial.shape[1:])
+
+# Taylor mode: rather than one tangent, each node carries the coefficients of the
+# Taylor series of its value along a line x + t·v through the inputs, up to t^K:
+# `coefficients[k]` is (d^k/dt^k value) / k!. Sums add them, and products convolve
+# them, so one sweep costs O(K²) per node and gives every directional derivative
+# up to order K (see `taylor_derivatives`). Lists may be shorter than K + 1 (a
+# Constant has just its value); missing coefficients are zero.
+def coefficient(node, k: int):
+  coefficients = node.coefficients
+  return coefficients[k] if k < len(coefficients) else 0.0
+
+# Coefficients of a product: c_k = sum over j of a_j · b_(k-j), with PRODUCT
+# multiplying two coefficients (`*`, `@`, ...).
+def convolve(a, b, order: int, product):
+  ca, cb = a.coefficients, b.coefficients
+  length = min(order + 1, len(ca) + len(cb) - 1)
+  return [ sum(product(ca[j], cb[k - j]) for j in range(max(0, k - len(cb) + 1), min(k, len(ca) - 1) + 1)) for k in range(length) ]
+
 class Diff(): 
+  # Let our overloads win over NumPy's when an array meets a node (e.g. `array * x`).
+  __array_ufunc__ = None
+  commutative = False
+  broadcasts = False
+  mark = 0
+  order_version = -1
+
+  def __new__(cls, *args, **kwargs):
+    node = super().__new__(cls)
+    node.serial = next(creation)
+    return node
+
   def __add__(self, b):
-    return Add(self, lift(b))
+    return make(Add, self, lift(b))
   
   def __radd__(self, b): 
-    return Add(lift(b), self)
+    return make(Add, lift(b), self)
 
   def __sub__(self, b):
-    return Sub(self, lift(b))
+    return make(Sub, self, lift(b))
+
+  def __rsub__(self, b):
+    return make(Sub, lift(b), self)
   
   def __mul__(self, b):
-    return Mul(self, lift(b))
+    return make(Mul, self, lift(b))
+
+  def __rmul__(self, b):
+    return make(Mul, lift(b), self)
   
   def __truediv__(self, b):
-    return Div(self, lift(b))
-  
+    return make(Div, self, lift(b))
+
+  def __rtruediv__(self, b):
+    return make(Div, lift(b), self)
+
+  def __matmul__(self, b):
+    return make(MatMul, self, lift(b))
+
+  def __rmatmul__(self, b):
+    return make(MatMul, lift(b), self)
+
+  def sum(self):
+    return make(Sum, self)
+
+  def dot(self, b):
+    return make(Dot, self, lift(b))
+
+  # The parents' partials, aligned for parents that broadcast against each other.
+  def partials(self):
+    a,b = self.parents
+    return tangent(a, self), tangent(b, self)
+
+# Elementwise binary ops remember whether their operands broadcast, so that the
+# common all-scalar case can skip the extra work. A plain float result can only
+# come from two scalars, which spares us looking at shapes at all.
+def elementwise(node, a, b):
+  node.parents = [a, b]
+  if type(node.value) is not float and shape(a.value) != shape(b.value):
+    node.broadcasts = True
 
 class Constant(Diff):
   def __init__(self, value: float): 
@@ -64,6 +201,12 @@ class Constant(Diff):
   def forward(self): # New: Forward partial derivative
     self.partial = 0.0 
 
+  def taylor(self, order: int):
+    self.coefficients = [self.value]
+
+  def evaluate(self):
+    pass
+
 class Variable(Diff):
   def __init__(self, name: str, value: float):
     self.name = name
@@ -73,49 +216,266 @@ class Variable(Diff):
   def set_partial(self, partial):
     self.partial = partial
 
+  def set_coefficients(self, coefficients):
+    self.coefficients = coefficients
+
   def forward(self):
     pass
+
+  def taylor(self, order: int):
+    pass
+
+  def evaluate(self):
+    pass
     
 class Add(Diff): 
+  commutative = True
+
   def __init__(self, a: Diff, b: Diff):
     self.value = a.value + b.value
-    self.parents = [a, b]
+    elementwise(self, a, b)
+
+  # Recompute the value in place, once the inputs have changed
+  def evaluate(self): 
+    a,b = self.parents
+    self.value = a.value + b.value
 
   def forward(self): 
     a,b = self.parents
-    self.partial = a.partial + b.partial
+    da,db = self.partials() if self.broadcasts else (a.partial, b.partial)
+    self.partial = da + db
+
+  def taylor(self, order: int):
+    a,b = self.parents
+    length = max(len(a.coefficients), len(b.coefficients))
+    self.coefficients = [ coefficient(a, k) + coefficient(b, k) for k in range(length) ]
 
 class Sub(Diff): 
   def __init__(self, a: Diff, b: Diff):
     self.value = a.value - b.value
-    self.parents = [a, b]
+    elementwise(self, a, b)
+
+  def evaluate(self): 
+    a,b = self.parents
+    self.value = a.value - b.value
 
   def forward(self): 
     a,b = self.parents
-    self.partial = a.partial - b.partial
+    da,db = self.partials() if self.broadcasts else (a.partial, b.partial)
+    self.partial = da - db
+
+  def taylor(self, order: int):
+    a,b = self.parents
+    length = max(len(a.coefficients), len(b.coefficients))
+    self.coefficients = [ coefficient(a, k) - coefficient(b, k) for k in range(length) ]
 
 class Mul(Diff):
+  commutative = True
+
   def __init__(self, a: Diff, b: Diff):
     self.value = a.value * b.value
-    self.parents = [a, b]
+    elementwise(self, a, b)
+
+  def evaluate(self): 
+    a,b = self.parents
+    self.value = a.value * b.value
 
   def forward(self): 
     a,b = self.parents
+    da,db = self.partials() if self.broadcasts else (a.partial, b.partial)
     # Product rule!
-    self.partial = (a.value * b.partial) + (a.partial * b.value)
+    self.partial = (a.value * db) + (da * b.value)
+
+  def taylor(self, order: int):
+    a,b = self.parents
+    self.coefficients = convolve(a, b, order, lambda x, y: x * y)
 
 class Div(Diff):
   def __init__(self, a: Diff, b: Diff):
     self.value = a.value / b.value
-    self.parents = [a, b] 
+    elementwise(self, a, b)
+
+  def evaluate(self): 
+    a,b = self.parents
+    self.value = a.value / b.value
 
   def forward(self): 
     a,b = self.parents
+    da,db = self.partials() if self.broadcasts else (a.partial, b.partial)
     # Quotient Rule!
-    numerator = (b.value * a.partial) - (a.value * b.partial)
+    numerator = (b.value * da) - (a.value * db)
     denominator = b.value * b.value
     self.partial = numerator / denominator
 
+  # From a = c · b: c_k = (a_k - sum over j >= 1 of b_j · c_(k-j)) / b_0
+  def taylor(self, order: int):
+    a,b = self.parents
+    b0 = b.coefficients[0]
+    if len(b.coefficients) == 1:
+      self.coefficients = [ c / b0 for c in a.coefficients ]
+      return
+    c = []
+    for k in range(order + 1):
+      total = coefficient(a, k)
+      for j in range(1, min(k, len(b.coefficients) - 1) + 1):
+        total = total - b.coefficients[j] * c[k - j]
+      c.append(total / b0)
+    self.coefficients = c
+
+# A node's partial either carries the leading tangent axis, or is the 0.0 of a
+# node that depends on no input.
+def has_tangent(node):
+  return ndim(node.partial) > ndim(node.value)
+
+# Matrix products of vectors and matrices, as with `@` on NumPy arrays.
+class MatMul(Diff):
+  def __init__(self, a: Diff, b: Diff):
+    if not (1 <= ndim(a.value) <= 2 and 1 <= ndim(b.value) <= 2):
+      raise ValueError("MatMul takes vectors and matrices")
+    self.value = a.value @ b.value
+    self.parents = [a, b]
+
+  def evaluate(self):
+    a,b = self.parents
+    self.value = a.value @ b.value
+
+  def forward(self):
+    a,b = self.parents
+    partial = 0.0
+    if has_tangent(a): # (k, ..., n) @ (n, ...)
+      partial = partial + np.tensordot(a.partial, b.value, axes = (-1, 0))
+    if has_tangent(b): # (..., n) @ (k, n, ...), with k moved back to the front
+      partial = partial + np.moveaxis(np.tensordot(a.value, b.partial, axes = (-1, 1)), ndim(a.value) - 1, 0)
+    self.partial = partial
+
+  def taylor(self, order: int):
+    a,b = self.parents
+    self.coefficients = convolve(a, b, order, lambda x, y: x @ y)
+
+# Fused reductions: rather than a left-deep chain of binary Adds (and Muls), one
+# node covers a whole sum over N terms, with one derivative rule looping over all
+# of them. Every term is reduced to the sum of its elements, so a single array
+# parent gives the sum of an array, and N scalar parents their plain sum.
+def reduce(value):
+  return value if ndim(value) == 0 else np.sum(value)
+
+def reduce_sum(values):
+  total = 0.0
+  for value in values:
+    total = total + reduce(value)
+  return total
+
+# sum(x * y) for two values of the same shape.
+def inner(x, y):
+  return x * y if ndim(x) == 0 else np.vdot(x, y)
+
+# Tangent of sum(x * y) coming from x's tangent alone, with Y x's partner value.
+def inner_tangent(x, y):
+  if ndim(x.value) == 0:
+    return x.partial * y
+  if has_tangent(x):
+    return x.partial.reshape(x.partial.shape[0], -1) @ np.ravel(y)
+  return 0.0 # An array that depends on no input
+
+# Coefficient-wise sum of Taylor coefficient lists of any lengths.
+def add_series(series):
+  total = []
+  for coefficients in series:
+    for (k, c) in enumerate(coefficients):
+      if k < len(total):
+        total[k] = total[k] + c
+      else:
+        total.append(c)
+  return total
+
+# The sum of all elements of every term.
+class Sum(Diff):
+  commutative = True
+
+  def __init__(self, *terms: Diff):
+    self.value = reduce_sum(term.value for term in terms)
+    self.parents = list(terms)
+
+  def evaluate(self):
+    self.value = reduce_sum(term.value for term in self.parents)
+
+  def forward(self):
+    partial = 0.0
+    for term in self.parents:
+      if ndim(term.value) == 0:
+        partial = partial + term.partial
+      elif has_tangent(term):
+        partial = partial + term.partial.reshape(term.partial.shape[0], -1).sum(axis = 1)
+      else:
+        partial = partial + np.sum(term.partial)
+    self.partial = partial
+
+  def taylor(self, order: int):
+    self.coefficients = add_series([ reduce(c) for c in term.coefficients ] for term in self.parents)
+
+# The sum of the squares of all elements of every term.
+class SumOfSquares(Diff):
+  commutative = True
+
+  def __init__(self, *terms: Diff):
+    self.value = reduce_sum(inner(term.value, term.value) for term in terms)
+    self.parents = list(terms)
+
+  def evaluate(self):
+    self.value = reduce_sum(inner(term.value, term.value) for term in self.parents)
+
+  def forward(self):
+    partial = 0.0
+    for term in self.parents:
+      partial = partial + 2 * inner_tangent(term, term.value)
+    self.partial = partial
+
+  def taylor(self, order: int):
+    self.coefficients = add_series(convolve(term, term, order, inner) for term in self.parents)
+
+# Inner products summed over pairs: Dot(a_1, ..., a_n, b_1, ..., b_n) is the sum
+# of sum(a_i * b_i), each pair of arrays having the same shape.
+class Dot(Diff):
+  commutative = True
+
+  def __init__(self, *terms: Diff):
+    if len(terms) % 2 != 0:
+      raise ValueError("Dot takes as many left as right operands")
+    half = len(terms) // 2
+    for (a, b) in zip(terms[:half], terms[half:]):
+      if shape(a.value) != shape(b.value):
+        raise ValueError(f"Dot of arrays with different shapes {shape(a.value)} and {shape(b.value)}")
+    self.parents = list(terms)
+    self.value = reduce_sum(inner(a.value, b.value) for (a, b) in self.pairs())
+
+  def pairs(self):
+    half = len(self.parents) // 2
+    return zip(self.parents[:half], self.parents[half:])
+
+  def evaluate(self):
+    self.value = reduce_sum(inner(a.value, b.value) for (a, b) in self.pairs())
+
+  def forward(self):
+    partial = 0.0
+    for (a, b) in self.pairs():
+      partial = partial + inner_tangent(a, b.value) + inner_tangent(b, a.value)
+    self.partial = partial
+
+  def taylor(self, order: int):
+    self.coefficients = add_series(convolve(a, b, order, inner) for (a, b) in self.pairs())
+
+# Builders for the fused reductions over sequences of terms (nodes or numbers).
+def sum_of(terms):
+  return make(Sum, *(lift(term) for term in terms))
+
+def sum_of_squares(terms):
+  return make(SumOfSquares, *(lift(term) for term in terms))
+
+def dot(a, b):
+  if len(a) != len(b):
+    raise ValueError(f"dot of sequences of different lengths {len(a)} and {len(b)}")
+  return make(Dot, *(lift(term) for term in a), *(lift(term) for term in b))
+
 # Compute the the partial (dResult / dInput), assuming the inputs have already been set.
 def partial(result): 
   order = order_nodes(result)
@@ -135,11 +495,109 @@ def forward_gradient(result_node, *inputs):
     gradient.append(partial(result_node))
   return gradient
 
+# Vector forward mode: rather than one sweep per input, seed every input with a
+# row of the identity so that each node's partial is a NumPy array holding the
+# tangents for all inputs at once. The whole gradient then falls out of a single
+# sweep, with the Add/Sub/Mul/Div rules above doing array arithmetic unchanged.
+# `chunk_size` bounds the width of the tangent arrays for very wide inputs.
+def vector_gradient(result_node, *inputs, chunk_size=None): 
+  order = order_nodes(result_node)
+  return vector_sweep(order, result_node, inputs, chunk_size)
+
+# Seed each input's tangent. An input passed more than once gets the sum of its
+# seeds: the derivative along x of f(x, x) is the sum of both partials.
+def seed_partials(inputs, seeds): 
+  total = {}
+  for (input, seed) in zip(inputs, seeds): 
+    total[input] = total[input] + seed if input in total else seed
+  for (input, seed) in total.items(): 
+    input.set_partial(seed)
+
+# The sweep itself, over an order computed once by the caller.
+# Tangents go on a leading axis, so that inputs holding a batch of values (see
+# `batch_value_and_grad`) broadcast against them.
+def vector_sweep(order, result_node, inputs, chunk_size=None): 
+  n = len(inputs)
+  chunk_size = chunk_size or max(n, 1)
+  batch = np.broadcast_shapes(np.shape(result_node.value), *(np.shape(input.value) for input in inputs))
+  gradient = []
+  for start in range(0, n, chunk_size): 
+    stop = min(start + chunk_size, n)
+    width = stop - start
+    identity = np.eye(width).reshape((width, width) + (1,) * len(batch))
+    zero = np.zeros((width,) + (1,) * len(batch))
+    seed_partials(inputs, [ identity[i - start] if start <= i < stop else zero for i in range(n) ])
+    for node in order: 
+      node.forward()
+    # A result that does not depend on any input is left with a scalar 0.0
+    partials = np.broadcast_to(result_node.partial, (width,) + batch)
+    gradient.extend(partials.tolist() if len(batch) == 0 else list(partials))
+  return gradient
+
+# Batched ("vmap"-style) evaluation: each row of POINTS is one set of inputs.
+# Every input holds a whole column of values, so a single graph and a single
+# sweep give the values (B,) and gradients (B, n) for the whole batch.
+def batch_value_and_grad(f, points): 
+  points = np.asarray(points, dtype=float)
+  inputs = [ Variable(f"x_{i}", points[:, i]) for i in range(points.shape[1]) ]
+  result_node = lift(f(*inputs))
+  gradient = vector_gradient(result_node, *inputs)
+  values = np.broadcast_to(result_node.value, points.shape[:1])
+  return values, np.stack(gradient, axis=-1)
+
+# Gradient with respect to array-valued inputs: every element of every input is
+# seeded with a row of the identity, so one sweep gives the derivatives with respect
+# to all of them, `chunk_size` elements at a time. Each gradient has the shape of
+# its input; for an array-valued result, it is the gradient of the sum of its elements.
+def tensor_gradient(result_node, *inputs, chunk_size=None): 
+  order = order_nodes(result_node)
+  shapes = [ shape(input.value) for input in inputs ]
+  sizes = [ int(np.prod(s)) for s in shapes ]
+  offsets = np.cumsum([0] + sizes)
+  total = int(offsets[-1])
+  chunk_size = chunk_size or max(total, 1)
+  flat = np.zeros(total)
+  for start in range(0, total, chunk_size): 
+    stop = min(start + chunk_size, total)
+    width = stop - start
+    seeds = []
+    for (s, size, offset) in zip(shapes, sizes, offsets): 
+      seed = np.zeros((width, size))
+      elements = np.arange(max(start, offset), min(stop, offset + size))
+      seed[elements - start, elements - offset] = 1.0
+      seeds.append(seed.reshape((width,) + s))
+    seed_partials(inputs, seeds)
+    for node in order: 
+      node.forward()
+    if has_tangent(result_node): 
+      flat[start:stop] = result_node.partial.reshape(width, -1).sum(axis = 1)
+  gradient = [ flat[offset:offset + size].reshape(s) for (s, size, offset) in zip(shapes, sizes, offsets) ]
+  return [ float(g) if g.ndim == 0 else g for g in gradient ]
+
+# Derivatives of the result along DIRECTION, up to ORDER: d^k/dt^k f(x + t·v) at
+# t = 0, for k = 0 ... ORDER, from one Taylor mode sweep. The first is the value,
+# the second the directional derivative, the third the curvature vᵀHv, and so on.
+# Array-valued inputs take array-valued directions of the same shape.
+def taylor_derivatives(result_node, inputs, direction, order: int = 2): 
+  directions = {} # As for partials, a repeated input moves along the sum of its directions
+  for (input, v) in zip(inputs, direction): 
+    directions[input] = directions[input] + v if input in directions else v
+  for (input, v) in directions.items(): 
+    input.set_coefficients([input.value, v])
+  for node in order_nodes(result_node): 
+    node.taylor(order)
+  factorial = 1
+  derivatives = []
+  for k in range(order + 1): 
+    factorial *= max(k, 1)
+    derivatives.append(factorial * coefficient(result_node, k))
+  return derivatives
+
 # "Lift" the function F to a new function that takes the same arguments and returns the gradient.
 def grad(f): 
   def g(*inputs): 
     result_node = f(*inputs)
-    return forward_gradient(result_node, *inputs)
+    return vector_gradient(result_node, *inputs)
   return g
 
 # Our function
@@ -167,9 +625,37 @@ def main():
 
   g = forward_gradient(z, x, y)
   print("g:", g)
+  print("vector g:", vector_gradient(z, x, y))
 
   gradF = grad(foo)
   print("∇F:", gradF(x, y))
 
+  # One sweep over a whole batch of (x, y) points
+  values, gradients = batch_value_and_grad(foo, [[5, 3], [1, 1], [0, 2]])
+  print("batch values:", values)
+  print("batch ∇F:", gradients.tolist())
+
+  # Least squares with one node per matrix operation, rather than one per multiply
+  A = Variable("A", np.arange(6.0).reshape(2, 3))
+  x = Variable("x", np.array([1.0, -1.0, 2.0]))
+  r = A @ x - np.array([1.0, 2.0])
+  loss = r.dot(r)
+  print("loss:", loss.value)
+  dA, dx = tensor_gradient(loss, A, x)
+  print("∂loss/∂A:", dA.tolist())
+  print("∂loss/∂x:", dx.tolist())
+
+  # Higher derivatives along a line, in one sweep: f = u / (1 + u·w) along (1, 0)
+  # at (1, 2) is t ↦ (1 + t) / (3 + 2t), whose derivatives are 1/3, 1/9, -4/27 and 8/27
+  u = Variable("u", 1.0)
+  w = Variable("w", 2.0)
+  f = u / (1 + u * w)
+  print("taylor derivatives:", taylor_derivatives(f, [u, w], [1.0, 0.0], order = 3))
+  print("                   ", [1/3, 1/9, -4/27, 8/27])
+  # Slope and curvature of the least squares loss along v: ∂loss/∂x · v and 2 |A·v|²
+  v = np.array([1.0, 0.0, -1.0])
+  _, slope, curvature = taylor_derivatives(loss, [A, x], [np.zeros((2, 3)), v])
+  print("loss slope and curvature along v:", slope, curvature, "expected:", np.dot(dx, v), 2 * np.sum((A.value @ v) ** 2))
+
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,145 @@
+# Dense Jacobians: forward, reverse, or both
+#
+# For F from n inputs to m outputs, vector forward mode gets the whole Jacobian
+# from one sweep with n-wide tangents, and vector reverse mode from one sweep
+# with m-wide adjoints. Whichever of n and m is smaller wins. But a graph can be
+# narrower in the middle than at either end: if every path from the inputs to the
+# outputs crosses a set C of k nodes, then J = J(outputs <- C) · J(C <- inputs).
+# A reverse sweep over the nodes below the cut gives the (k x n) factor, and a
+# forward sweep over the nodes above it the (m x k) one, both only k wide.
+#
+# Cutting the topological order at position p, the nodes that cross the cut are
+# those at or before p, that depend on an input, and are used after p (or are
+# outputs). Cutting right after the inputs is forward mode, and cutting after the
+# last node is reverse mode. Every other cut is a mixed strategy; we take the narrowest.
+import numpy as np
+import forward
+import reverse
+from sparse_jacobian import trace
+
+MODES = ["auto", "forward", "reverse", "mixed"]
+
+# A rough cost model for "auto", per node swept, in units of the fixed cost of one
+# array operation: each element of the sweep's width costs about 1/WIDTH of that,
+# and strategies sweeping in reverse pay for tracing a second graph.
+WIDTH = 200
+RETRACE = 2
+
+def cost(strategy: str, width: int):
+  return 1 + width / WIDTH + (RETRACE if strategy != "forward" else 0)
+
+# The narrowest cut of ORDER: the position to cut after, and the nodes crossing it.
+def narrowest_cut(order, inputs, outputs):
+  position = { node: i for (i, node) in enumerate(order) }
+  varying = set(inputs) # Nodes that depend on some input
+  last_use = {}
+  for (i, node) in enumerate(order):
+    for parent in node.parents:
+      last_use[parent] = i
+      if parent in varying:
+        varying.add(node)
+  for output in outputs:
+    last_use[output] = len(order)
+  crossing = np.zeros(len(order) + 1, dtype = int)
+  for node in varying:
+    if node in position and last_use.get(node, position[node]) > position[node]:
+      crossing[position[node]] += 1
+      crossing[last_use[node]] -= 1
+  widths = np.cumsum(crossing)[:-1]
+  # Cuts must come after every input the outputs depend on
+  first = max((position[input] for input in inputs if input in position), default = 0)
+  p = first + int(np.argmin(widths[first:]))
+  cut = [ node for node in order[:p + 1] if node in varying and last_use.get(node, -1) > p ]
+  return p, cut
+
+# Forward sweep over ORDER, with SEEDS (node -> tangent) set first. Rows: the outputs.
+def forward_rows(order, seeds, outputs, width: int):
+  for (node, seed) in seeds.items():
+    node.partial = seed
+  for node in order:
+    if node not in seeds:
+      node.forward()
+  return np.array([ np.broadcast_to(output.partial, (width,)) for output in outputs ])
+
+# Reverse sweep over ORDER, with output i seeded with row i of the identity.
+# Columns: the inputs.
+def reverse_columns(order, inputs, outputs):
+  width = len(outputs)
+  identity = np.eye(width)
+  for node in order:
+    node.adjoint = 0.0
+  for input in inputs:
+    input.adjoint = 0.0
+  for (i, output) in enumerate(outputs):
+    output.adjoint = output.adjoint + identity[i]
+  for node in reversed(order):
+    node.d()
+  return np.array([ np.broadcast_to(input.adjoint, (width,)) for input in inputs ]).T.reshape(width, len(inputs))
+
+# "Lift" a vector-valued F (a list of parameters -> a list of outputs) to a function
+# returning its dense (m x n) Jacobian. With mode "auto", the cheapest strategy
+# (see `cost`) is used: forward (n wide), reverse (m wide) or mixed (k wide).
+def jacobian(f, mode="auto"):
+  if mode not in MODES:
+    raise ValueError(f"unknown mode: {mode}")
+  def J(x):
+    inputs, outputs, order = trace(forward, f, x)
+    n, m = len(inputs), len(outputs)
+    p, cut = narrowest_cut(order, inputs, outputs)
+    chosen = mode
+    if mode == "auto":
+      chosen = min([("forward", n), ("reverse", m), ("mixed", len(cut))], key = lambda c: cost(*c))[0]
+    J.mode = chosen # For the curious: which strategy ran, and how wide its sweeps were
+    if chosen == "forward":
+      J.width = n
+      identity = np.eye(n)
+      return forward_rows(order, { input: identity[j] for (j, input) in enumerate(inputs) }, outputs, n).reshape(m, n)
+
+    # Reverse sweeps need the graph in reverse mode nodes: trace again, it lines up node for node
+    r_inputs, r_outputs, r_order = trace(reverse, f, x)
+    if len(r_order) != len(order):
+      raise ValueError("f traced to different graphs in forward and reverse mode")
+    if chosen == "reverse":
+      J.width = m
+      return reverse_columns(r_order, r_inputs, r_outputs)
+
+    J.width = k = len(cut)
+    position = { node: i for (i, node) in enumerate(order) }
+    below = reverse_columns(r_order[:p + 1], r_inputs, [ r_order[position[c]] for c in cut ]) # (k x n)
+    identity = np.eye(k)
+    seeds = { node: np.zeros(k) for node in order[:p + 1] }
+    seeds.update({ c: identity[r] for (r, c) in enumerate(cut) })
+    above = forward_rows(order, seeds, outputs, k).reshape(m, k) # (m x k)
+    return above @ below
+  return J
+
+def main():
+  from timeit import default_timer as timer
+
+  # Few inputs, many outputs: forward mode
+  def constraints(args):
+    ax, ay, bx, by = args
+    return [ (ax - bx) * (ax - bx) + (ay - by) * (ay - by) - (i + 1) * (bx * bx + by * by) / 100 for i in range(200) ]
+
+  # Many inputs and many outputs, through a narrow middle: mixed
+  def bottleneck(args):
+    total = 0
+    moment = 0
+    for (i, a) in enumerate(args):
+      total = total + a * a
+      moment = moment + i * a
+    return [ total * (1 + i) - moment / (1 + i) for i in range(len(args)) ]
+
+  for (name, f, x) in [("constraints (4 -> 200)", constraints, [10.0, 10.0, 20.0, 20.0]),
+                       ("bottleneck (1000 -> 1000)", bottleneck, [ 0.001 * i for i in range(1000) ])]:
+    print(f" -- {name} -- ")
+    results = {}
+    for mode in ["forward", "reverse", "mixed", "auto"]:
+      J = jacobian(f, mode)
+      start = timer()
+      results[mode] = J(x)
+      print(f"{mode:>8}: {J.mode}, {J.width} wide, {(timer() - start) * 1e3:.2f}ms")
+    print("max difference between modes:", max(np.abs(results[mode] - results["forward"]).max() for mode in results))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,135 @@
+# Compiling once: a cache of jit-compiled functions, in memory and on disk
+#
+# As jax_jit_caveats.py shows, the first call of a `jit`-ed function pays for
+# tracing and compiling it. `jax.jit` keeps its compiled code on the function
+# object it returns, so calling `jit(value_and_grad(f))` afresh on every solve
+# (as opt_jax.call_scipy did) compiles every time, and every new process starts
+# from scratch. Here:
+#  - compiled executables are kept per (transformation, function, input shape and
+#    dtype), however many times they are asked for. The cache holds the functions
+#    and executables alive, so it keeps only the MAX_EXECUTABLES most recently
+#    used, and `clear` empties it;
+#  - JAX's persistent compilation cache is switched on, so that a process
+#    compiling a function another process already compiled reads it from disk;
+#  - `warmup` compiles ahead of time, e.g. when a service starts.
+#
+# Functions are matched by identity (bound methods by object and method), so a
+# lambda created anew on every call always misses in memory. The disk cache,
+# keyed on the compiled program itself, still catches it.
+import os
+import jax
+import jax.numpy as jnp
+from collections import Counter, OrderedDict
+from timeit import default_timer as timer
+
+# Where compiled programs go; JAX_COMPILATION_CACHE_DIR overrides it, as it does for JAX.
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "ad", "jax")
+
+directory = None # Set once the persistent cache is on
+
+def enable_persistent_cache(path: str = None):
+  global directory
+  path = path or os.environ.get("JAX_COMPILATION_CACHE_DIR") or DEFAULT_DIRECTORY
+  if path == directory:
+    return
+  os.makedirs(path, exist_ok = True)
+  jax.config.update("jax_compilation_cache_dir", path)
+  # Our programs are small and quick to compile: keep all of them, not just slow ones
+  jax.config.update("jax_persistent_cache_min_compile_time_secs", 0.0)
+  jax.config.update("jax_persistent_cache_min_entry_size_bytes", 0)
+  directory = path
+
+# What we compile, from the function F a caller hands us.
+def stacked(f):
+  return lambda x: jnp.stack(f(x))
+
+TRANSFORMS = {
+  "value": lambda f: f,
+  "value_and_grad": jax.value_and_grad,
+  # F returns a list of constraint values: their values and (m x n) Jacobian together
+  "constraints": lambda f: (lambda x: (stacked(f)(x), jax.jacfwd(stacked(f))(x))),
+}
+
+MAX_EXECUTABLES = 64
+executables = OrderedDict() # (transform, f, shape, dtype) -> compiled executable, least recently used first
+stats = Counter() # Executables "compiled" (traced and compiled, or read from disk), "reused" and "evicted"
+
+def executable(transform: str, f, x):
+  key = (transform, f, x.shape, x.dtype)
+  compiled = executables.get(key)
+  if compiled is None:
+    enable_persistent_cache()
+    stats["compiled"] += 1
+    compiled = executables[key] = jax.jit(TRANSFORMS[transform](f)).lower(x).compile()
+    if len(executables) > MAX_EXECUTABLES:
+      executables.popitem(last = False)
+      stats["evicted"] += 1
+  else:
+    executables.move_to_end(key)
+    stats["reused"] += 1
+  return compiled
+
+# Drop every executable, and the functions they were compiled from.
+def clear():
+  executables.clear()
+
+# F, transformed and jit-compiled through the cache: call it like `jit(value_and_grad(f))`.
+def jitted(f, transform: str = "value_and_grad"):
+  if transform not in TRANSFORMS:
+    raise ValueError(f"unknown transform: {transform}")
+  def call(x):
+    x = jnp.asarray(x, dtype = float)
+    return executable(transform, f, x)(x)
+  return call
+
+# Compile F for inputs shaped like X ahead of time, with each of TRANSFORMS
+# ("value_and_grad" by default). Returns the seconds spent.
+def warmup(f, x, *transforms: str):
+  start = timer()
+  x = jnp.asarray(x, dtype = float)
+  for transform in transforms or ("value_and_grad",):
+    if transform not in TRANSFORMS:
+      raise ValueError(f"unknown transform: {transform}")
+    executable(transform, f, x)
+  return timer() - start
+
+def main():
+  import contextlib
+  import io
+  import subprocess
+  import sys
+  import tempfile
+  import jax_cache # This file as the others import it, rather than as __main__
+  from objectives import linear_regression
+  from opt_jax import call_scipy
+
+  with tempfile.TemporaryDirectory() as path:
+    jax_cache.enable_persistent_cache(path)
+    print(f"warmup: {jax_cache.warmup(linear_regression, [1.0, 1.0, 0.0]) * 1e3:.1f}ms")
+    for _ in range(3):
+      start = timer()
+      with contextlib.redirect_stdout(io.StringIO()):
+        call_scipy(linear_regression, [1, 1, 0])
+      print(f"call_scipy: {(timer() - start) * 1e3:.1f}ms")
+    print("executables:", dict(jax_cache.stats))
+
+    # Fresh lambdas always miss in memory: the cache stays bounded, and evicted ones are freed
+    for scale in range(jax_cache.MAX_EXECUTABLES + 8):
+      jax_cache.warmup(lambda x, scale = scale: scale * jnp.sum(x * x), [1.0, 2.0])
+    print(f"after {jax_cache.MAX_EXECUTABLES + 8} throwaway functions:", len(jax_cache.executables), "kept,", dict(jax_cache.stats))
+
+    # A fresh process (a worker, or the next short-lived job) reads the compiled program from disk
+    script = (
+      "import sys, jax_cache; from objectives import linear_regression\n"
+      "jax_cache.enable_persistent_cache(sys.argv[1])\n"
+      "print(f'{jax_cache.warmup(linear_regression, [1.0, 1.0, 0.0]) * 1e3:.1f}ms')"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as empty:
+      for (label, cache) in [("a new process, empty cache", empty), ("a new process, warm cache", path)]:
+        output = subprocess.run([sys.executable, "-c", script, cache], cwd = here, capture_output = True, text = True, check = True).stdout
+        print(f"warmup in {label}: {output.strip()}")
+    print("on disk:", len(os.listdir(path)), "entries")
+
+if __name__ == "__main__":
+  main()
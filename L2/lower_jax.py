@@ -0,0 +1,260 @@
+# Lowering traced graphs to JAX
+#
+# Our engines run any Python objective through operator overloading, while JAX
+# needs code written against `jax.numpy`. A graph traced with our engines is
+# already a straight-line program though: walking it in topological order and
+# applying the `jax.numpy` counterpart of every node gives a function JAX can
+# trace in turn, and then `jit`, `grad` and `vmap` like any other. Under `jit`
+# the walk happens once, at tracing time, and XLA compiles the result.
+#
+# Emitting one jax.numpy call per node makes the XLA program as large as the
+# graph, and compile time grows faster than that: seconds for a few hundred
+# nodes, tens of seconds for under a thousand. So graphs whose nodes all hold
+# scalars are lowered level by level instead. A node's level is the length of
+# the longest path from a leaf to it, so nodes on one level only depend on lower
+# levels, and all the Adds (Muls, ...) of a level become a single gather of their
+# operands followed by one vectorized operation. The fused Sum, SumOfSquares and
+# Dot nodes of a level become one segmented sum each. The program then grows
+# with the depth of the graph rather than with its size. Graphs holding arrays
+# (MatMul and friends) are vectorized already, and are lowered node by node.
+#
+# Caveats: as with tracing.py, control flow is frozen at the traced point. And a
+# deep graph still compiles slowly, a few operations per level: flatten it first
+# (passes.optimize), which turns accumulation chains into single fused nodes,
+# and mind `lower_objective`'s `max_operations`.
+import jax
+import jax.numpy as jnp
+import numpy as np
+import passes
+import forward
+
+def scalars(terms):
+  return all(jnp.ndim(term) == 0 for term in terms)
+
+# Scalar terms are stacked into one array, so the whole reduction is one operation.
+def reduction(f):
+  def reduce(*terms):
+    if scalars(terms):
+      return f(jnp.stack(terms))
+    return sum(f(term) for term in terms)
+  return reduce
+
+def dot(*terms):
+  half = len(terms) // 2
+  a, b = terms[:half], terms[half:]
+  if scalars(terms):
+    return jnp.sum(jnp.stack(a) * jnp.stack(b))
+  return sum(jnp.vdot(x, y) for (x, y) in zip(a, b))
+
+# The jax.numpy counterpart of each node type, by name, so that graphs from either
+# engine (forward.py or reverse.py) can be lowered.
+LOWERINGS = {
+  "Add": lambda a, b: a + b,
+  "Sub": lambda a, b: a - b,
+  "Mul": lambda a, b: a * b,
+  "Div": lambda a, b: a / b,
+  "MatMul": jnp.matmul,
+  "Sum": reduction(jnp.sum),
+  "SumOfSquares": reduction(lambda term: jnp.sum(term * term)),
+  "Dot": dot,
+}
+
+# Level by level, each step reads the vector of every value so far and returns
+# those of one group of nodes: binary ops from the gathered values of their two
+# parents, and fused reductions (of any number of parents) as sums over segments
+# of their gathered terms, one segment per node.
+BINARY = ["Add", "Sub", "Mul", "Div"]
+
+def binary_step(op):
+  return lambda values, lhs, rhs: op(values[lhs], values[rhs])
+
+def reduction_step(name: str, count: int):
+  if name == "Dot":
+    return lambda values, lhs, rhs, segments: jax.ops.segment_sum(values[lhs] * values[rhs], segments, count)
+  if name == "SumOfSquares":
+    return lambda values, terms, segments: jax.ops.segment_sum(values[terms] * values[terms], segments, count)
+  return lambda values, terms, segments: jax.ops.segment_sum(values[terms], segments, count)
+
+# A function of the values of INPUTS (one argument per input, in order) computing
+# RESULT with jax.numpy. Leaves that are not inputs are baked in as constants.
+# Its `operations` counts the vectorized steps (or nodes) it runs.
+def lower(result, inputs):
+  order = passes.topological_order(result)
+  for node in order:
+    name = type(node).__name__
+    if len(node.parents) != 0 and name not in LOWERINGS:
+      raise TypeError(f"cannot lower {name} nodes")
+  if all(np.ndim(node.value) == 0 for node in order):
+    return lower_levels(order, inputs)
+  return lower_nodes(order, inputs)
+
+def lower_levels(order, inputs):
+  # Slots in the vector of values: the inputs the result uses, the constants, and
+  # then each level's groups of nodes, in the order the steps append them.
+  in_order = set(order)
+  used = [ input for input in dict.fromkeys(inputs) if input in in_order ]
+  used_set = set(used)
+  leaves = used + [ node for node in order if len(node.parents) == 0 and node not in used_set ]
+  slot = { node: i for (i, node) in enumerate(leaves) }
+  constants = np.array([ float(node.value) for node in leaves[len(used):] ])
+  levels = {}
+  groups = {} # level -> node type name -> nodes
+  for node in order:
+    if len(node.parents) == 0:
+      levels[node] = 0
+    else:
+      levels[node] = 1 + max(levels[parent] for parent in node.parents)
+      groups.setdefault(levels[node], {}).setdefault(type(node).__name__, []).append(node)
+
+  steps = [] # Per level, a list of (step, index arrays)
+  for level in sorted(groups):
+    level_steps = []
+    for (name, nodes) in sorted(groups[level].items()):
+      if name in BINARY:
+        lhs = np.array([ slot[node.parents[0]] for node in nodes ])
+        rhs = np.array([ slot[node.parents[1]] for node in nodes ])
+        level_steps.append((binary_step(LOWERINGS[name]), (lhs, rhs)))
+      else:
+        if name == "Dot":
+          pairs = [ list(node.pairs()) for node in nodes ]
+          lhs = np.array([ slot[a] for node_pairs in pairs for (a, _) in node_pairs ], dtype = int)
+          rhs = np.array([ slot[b] for node_pairs in pairs for (_, b) in node_pairs ], dtype = int)
+          segments = np.repeat(np.arange(len(nodes)), [ len(node_pairs) for node_pairs in pairs ])
+          arrays = (lhs, rhs, segments)
+        else:
+          terms = np.array([ slot[term] for node in nodes for term in node.parents ], dtype = int)
+          segments = np.repeat(np.arange(len(nodes)), [ len(node.parents) for node in nodes ])
+          arrays = (terms, segments)
+        level_steps.append((reduction_step(name, len(nodes)), arrays))
+      for node in nodes:
+        slot[node] = len(slot)
+    steps.append(level_steps)
+  position = { input: i for (i, input) in enumerate(inputs) }
+  gather = np.array([ position[input] for input in used ], dtype = int)
+  result_slot = slot[order[-1]]
+
+  # From the values of the inputs the result uses, as one array
+  def run(leaves):
+    values = jnp.concatenate([leaves, jnp.asarray(constants, dtype = float)])
+    for level_steps in steps:
+      values = jnp.concatenate([values] + [ step(values, *arrays) for (step, arrays) in level_steps ])
+    return values[result_slot]
+
+  def lowered(*args):
+    if len(args) != len(inputs):
+      raise ValueError(f"expected {len(inputs)} inputs, got {len(args)}")
+    return run(jnp.stack([ jnp.asarray(args[i], dtype = float) for i in gather ]) if used else jnp.zeros(0))
+  # The same, from one array holding every input's value: a single gather
+  lowered.vector = lambda x: run(jnp.asarray(x, dtype = float)[gather])
+  lowered.operations = sum(len(level_steps) for level_steps in steps)
+  return lowered
+
+# One jax.numpy call per node, for graphs holding arrays.
+def lower_nodes(order, inputs):
+  index = { node: i for (i, node) in enumerate(order) }
+  slots = [ index.get(input) for input in inputs ] # None for inputs the result does not use
+  constants = [ node.value if len(node.parents) == 0 else None for node in order ]
+  steps = []
+  for (i, node) in enumerate(order):
+    if len(node.parents) != 0:
+      steps.append((i, LOWERINGS[type(node).__name__], [ index[parent] for parent in node.parents ]))
+
+  def lowered(*args):
+    if len(args) != len(inputs):
+      raise ValueError(f"expected {len(inputs)} inputs, got {len(args)}")
+    values = list(constants)
+    for (slot, arg) in zip(slots, args):
+      if slot is not None:
+        values[slot] = arg
+    for (i, op, parents) in steps:
+      values[i] = op(*(values[j] for j in parents))
+    return jnp.asarray(values[-1])
+  lowered.operations = len(steps)
+  return lowered
+
+# Past this many operations, compiling the lowered program takes seconds or more,
+# and the traced graph (tracing.compile) or generated code (codegen.jit) is the
+# better deal unless the objective is evaluated a great many times.
+MAX_OPERATIONS = 500
+
+# Trace F (a function of a list of parameters, as in objectives.py) at X, and lower
+# it to a function of one array of parameters: ready for jax.jit, jax.grad, jax.vmap
+# and opt_jax.call_scipy. With `simplify`, the graph goes through passes.optimize first.
+# Lowering to more than `max_operations` raises ValueError (None: no limit).
+def lower_objective(f, x, simplify: bool = True, max_operations: int = MAX_OPERATIONS):
+  inputs = [ forward.Variable(f"x_{i}", float(v)) for (i, v) in enumerate(x) ]
+  result = forward.lift(f(inputs))
+  stats = None
+  if simplify:
+    result, stats = passes.optimize(result)
+  lowered = lower(result, inputs)
+  if max_operations is not None and lowered.operations > max_operations:
+    raise ValueError(f"lowered to {lowered.operations} operations (max_operations = {max_operations}), "
+                     "which would take long to compile: use tracing.compile or codegen.jit, or raise the limit")
+  n = len(inputs)
+  def objective(x):
+    if hasattr(lowered, "vector"):
+      return lowered.vector(x)
+    return lowered(*(x[i] for i in range(n)))
+  objective.operations = lowered.operations
+  objective.stats = stats
+  return objective
+
+def main():
+  from timeit import default_timer as timer
+  from objectives import distance_to_line, linear_regression
+  from opt_jax import call_scipy
+  from tracing import compile
+
+  print(" -- Linear Regression -- ")
+  objective = lower_objective(linear_regression, [1, 1, 0])
+  print("operations:", objective.operations, dict(objective.stats))
+  print("value_and_grad(2, 1, 0):", jax.value_and_grad(objective)(jnp.array([2.0, 1.0, 0.0])))
+  print("traced:                 ", compile(linear_regression, 3).value_and_grad([2, 1, 0]))
+  print("vmap over 3 points:", jax.vmap(objective)(jnp.array([[1.0, 1.0, 0.0], [2.0, 1.0, 0.0], [1.0, -4.0, 8.0]])))
+  a, b, c = call_scipy(objective, [1, 1, 0])
+  print(f"y = {-a/b:.2f}x + {-c/b:.2f}")
+
+  # An objective written with our graph builders, which JAX cannot run directly
+  print("\n -- Chained Rosenbrock, graph API -- ")
+  def rosenbrock(args):
+    return forward.sum_of_squares([ 10 * (args[i + 1] - args[i] * args[i]) for i in range(len(args) - 1) ] +
+                                  [ 1 - args[i] for i in range(len(args) - 1) ])
+  n = 200
+  x = np.linspace(-1, 1, n)
+  objective = lower_objective(rosenbrock, x)
+  start = timer()
+  value_and_grad = jax.jit(jax.value_and_grad(objective))
+  value, gradient = value_and_grad(jnp.asarray(x))
+  print(f"operations: {objective.operations}, first call (trace + compile): {(timer() - start) * 1e3:.1f}ms")
+  traced = compile(rosenbrock, n)
+  reference_value, reference_gradient = traced.value_and_grad(x)
+  print("relative difference to the traced graph:", abs(float(value) - reference_value) / abs(reference_value),
+        float(np.abs(np.asarray(gradient) - reference_gradient).max() / np.abs(reference_gradient).max()))
+  runs = 200
+  start = timer()
+  for _ in range(runs):
+    jax.block_until_ready(value_and_grad(jnp.asarray(x)))
+  print(f"jit-ed: {(timer() - start) / runs * 1e3:.3f}ms per value_and_grad")
+  start = timer()
+  for _ in range(runs):
+    traced.value_and_grad(x)
+  print(f"traced: {(timer() - start) / runs * 1e3:.3f}ms per value_and_grad")
+
+  # Compile time stays flat as the data grows: the levels are as deep as one term
+  print("\n -- Linear regression over N points: first jit-ed value_and_grad -- ")
+  generator = np.random.default_rng(0)
+  for n_points in [100, 1000, 10000]:
+    points = generator.uniform(-5, 5, (n_points, 2)).tolist()
+    def regression(args):
+      total = 0 # A chain of Adds, flattened by passes.optimize
+      for point in points:
+        total = total + distance_to_line(args, point)
+      return total
+    objective = lower_objective(regression, [1.0, -4.0, 8.0])
+    start = timer()
+    jax.jit(jax.value_and_grad(objective))(jnp.array([1.0, -4.0, 8.0]))
+    print(f"{n_points:>6} points: {objective.operations} operations, {(timer() - start) * 1e3:.1f}ms")
+
+if __name__ == "__main__":
+  main()
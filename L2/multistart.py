@@ -0,0 +1,214 @@
+# Multi-start optimization
+#
+# A local solver finds the optimum downhill of wherever it starts, and
+# non-convex problems have many of those. Multi-start runs one local solve per
+# starting point and keeps the best. The solves are independent, so they go to a
+# pool of processes. Each worker compiles the objective (and constraints) once
+# when it starts, warms it up on the first starting point, and then reuses it for
+# every start it is handed.
+#
+# Results are streamed in the order the solves finish, and the whole run can stop
+# early: once a solve reaches `target`, starts that have not begun are dropped.
+import contextlib
+import io
+import math
+import multiprocessing
+import numpy as np
+import optimization
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy import optimize
+from timeit import default_timer as timer
+from typing import List, NamedTuple
+from opt_scipy import HESSP_METHODS
+from point_cache import ValueAndGradCache
+from tracing import compile
+
+class Result(NamedTuple):
+  start: int # Index of the starting point this solve began from
+  initial_parameters: List[float]
+  parameters: List[float]
+  loss: float
+  success: bool
+  evaluations: int # Calls to the compiled value_and_grad
+  seconds: float
+
+# Our own solvers, from optimization.py; any other method is handed to SciPy.
+SOLVERS = {
+  "gradient-descent": optimization.gradient_descent,
+  "newton-cg": optimization.newton_cg,
+  "lbfgs": optimization.lbfgs,
+}
+
+ENGINES = ["tracing", "jax"]
+
+# Raised inside a solve once the run is cancelled, to abandon it early.
+class Cancelled(Exception):
+  pass
+
+# FUNCTION, checking STOP (an Event, or None) before every call.
+def checking(stop, function):
+  def checked(*args):
+    if stop is not None and stop.is_set():
+      raise Cancelled()
+    return function(*args)
+  return checked
+
+# An objective whose methods all check STOP first, for our own solvers.
+class Checked():
+  def __init__(self, objective, stop):
+    self.objective = objective
+    self.stop = stop
+
+  def __getattr__(self, name):
+    attribute = getattr(self.objective, name)
+    return checking(self.stop, attribute) if callable(attribute) else attribute
+
+# Everything a worker needs to run solves: the compiled objective, and the
+# constraint values along with their Jacobian (SciPy's "ineq" constraints).
+class Worker():
+  def __init__(self, f, n_inputs: int, method: str, engine: str, constraints, warmup: List[float]):
+    self.method = method
+    self.engine = engine
+    if engine == "jax":
+      # Through the on-disk cache: workers after the first read the compiled code back
+      from jax_cache import jitted
+      self.value_and_grad = jitted(f)
+      self.hessp = None
+      if constraints is not None:
+        self.constraints = jitted(constraints, "constraints")
+    else:
+      self.objective = compile(f, n_inputs)
+      self.value_and_grad = self.objective.value_and_grad
+      self.hessp = self.objective.hvp if method in HESSP_METHODS else None
+      if constraints is not None:
+        # One traced graph per constraint; plain floats tell us how many there are
+        count = len(constraints([ float(v) for v in warmup ]))
+        compiled = [ compile(lambda x, i = i: constraints(x)[i], n_inputs) for i in range(count) ]
+        def values_and_jacobian(x):
+          rows = [ c.value_and_grad(x) for c in compiled ]
+          return [ value for (value, _) in rows ], [ gradient for (_, gradient) in rows ]
+        self.constraints = values_and_jacobian
+    if constraints is None:
+      self.constraints = None
+    # Trace (or jit-compile) everything up front, rather than inside the first solve
+    x = np.asarray(warmup, dtype = float)
+    self.value_and_grad(x)
+    if self.constraints is not None:
+      self.constraints(x)
+
+  # Solve from INITIAL_PARAMETERS. Every evaluation first checks STOP, and raises
+  # Cancelled once it is set, so that a cancelled run does not wait for this solve.
+  def solve(self, start: int, initial_parameters: List[float], stop=None):
+    began = timer()
+    cache = ValueAndGradCache(checking(stop, self.value_and_grad))
+    with contextlib.redirect_stdout(io.StringIO()): # Keep the solvers' progress out of the stream
+      if self.method in SOLVERS:
+        before = self.objective.evaluations["value_and_grad"]
+        parameters = SOLVERS[self.method](Checked(self.objective, stop), initial_parameters)
+        evaluations = self.objective.evaluations["value_and_grad"] - before
+        loss = checking(stop, self.objective.eval)(parameters) # Just the value: the solvers do not return it
+        success = True
+      else:
+        options = {}
+        if self.constraints is not None:
+          constraint_cache = ValueAndGradCache(checking(stop, self.constraints))
+          options["constraints"] = { "type": "ineq", "fun": constraint_cache.fun, "jac": constraint_cache.jac }
+        result = optimize.minimize(cache.fun, initial_parameters, jac = cache.jac, hessp = self.hessp, method = self.method, **options)
+        parameters, loss, success = result.x, result.fun, bool(result.success)
+        evaluations = cache.misses
+    return Result(start, list(initial_parameters), [ float(p) for p in parameters ], float(loss), success, evaluations, timer() - began)
+
+# The state of each worker process.
+worker = None
+stop = None
+
+def install(f, n_inputs, method, engine, constraints, warmup, stop_event):
+  global worker, stop
+  worker = Worker(f, n_inputs, method, engine, constraints, warmup)
+  stop = stop_event
+
+def run(start, initial_parameters):
+  try:
+    return worker.solve(start, initial_parameters, stop)
+  except Cancelled:
+    return None # Cancelled before it began, or while it ran
+
+# Solve from every one of STARTING_POINTS, yielding each Result as its solve finishes.
+# With `target`, stop as soon as a solve reaches a loss at or below it: starts
+# that have not begun are dropped, and solves still running are abandoned at
+# their next evaluation, without being waited for. Stopping iteration early
+# (e.g. with `break`) cancels the remaining starts too.
+def stream(f, starting_points, method: str = "SLSQP", engine: str = "tracing", constraints=None, workers: int = None, target: float = None):
+  starting_points = [ [ float(v) for v in x ] for x in starting_points ]
+  if engine not in ENGINES:
+    raise ValueError(f"unknown engine: {engine}")
+  if method in SOLVERS and (engine != "tracing" or constraints is not None):
+    raise ValueError(f"{method} runs on the tracing engine, without constraints")
+  if len(starting_points) == 0:
+    return
+  # JAX runs threads of its own, which do not survive a fork: start its workers fresh
+  context = multiprocessing.get_context("spawn" if engine == "jax" else None)
+  stop_event = context.Event()
+  initargs = (f, len(starting_points[0]), method, engine, constraints, starting_points[0], stop_event)
+  # Not a `with` block: leaving one waits for every solve still running
+  pool = ProcessPoolExecutor(workers, mp_context = context, initializer = install, initargs = initargs)
+  try:
+    futures = [ pool.submit(run, i, x) for (i, x) in enumerate(starting_points) ]
+    for future in as_completed(futures):
+      if future.cancelled():
+        continue
+      result = future.result()
+      if result is None:
+        continue
+      yield result
+      if target is not None and result.loss <= target:
+        break
+  finally:
+    stop_event.set()
+    pool.shutdown(wait = False, cancel_futures = True)
+
+# All results of a multi-start run, best first. Solves that did not converge rank
+# after those that did, and a NaN loss ranks last.
+def multistart(f, starting_points, method: str = "SLSQP", engine: str = "tracing", constraints=None, workers: int = None, target: float = None):
+  results = list(stream(f, starting_points, method, engine, constraints, workers, target))
+  return sorted(results, key = lambda r: (not r.success, math.isnan(r.loss), r.loss))
+
+# Starting points drawn uniformly from the box [low, high] in each dimension.
+def uniform_starts(low: List[float], high: List[float], count: int, seed: int = 0):
+  generator = np.random.default_rng(seed)
+  return generator.uniform(low, high, size = (count, len(low))).tolist()
+
+# Styblinski-Tang: a polynomial with a local minimum in each orthant, the best
+# of which is about -39.166 per dimension, at x_i = -2.9035.
+def styblinski_tang(args):
+  total = 0
+  for x in args:
+    x2 = x * x
+    total = total + (x2 * x2 - 16 * x2 + 5 * x) / 2
+  return total
+
+def main():
+  from objectives import linear_regression
+  from opt_jax_constraint_gradients import Model
+
+  print(" -- Linear Regression, 8 starts -- ")
+  starts = uniform_starts([-5, -5, -5], [5, 5, 5], 8)
+  for result in stream(linear_regression, starts, workers = 4):
+    print(f"start {result.start}: loss = {result.loss:.6f} after {result.evaluations} sweeps ({result.seconds * 1e3:.1f}ms)")
+
+  print("\n -- Styblinski-Tang (4D), L-BFGS, 64 starts, stop at loss < -156.6 -- ")
+  starts = uniform_starts([-5] * 4, [5] * 4, 64, seed = 1)
+  results = multistart(styblinski_tang, starts, method = "lbfgs", workers = 4, target = -156.6)
+  print(f"{len(results)} of {len(starts)} starts ran")
+  for result in results[:3]:
+    print(f"start {result.start}: loss = {result.loss:.4f} at {[ round(p, 4) for p in result.parameters ]}")
+
+  print("\n -- Constrained model, 16 starts -- ")
+  model = Model()
+  starts = uniform_starts([-50] * 4, [150] * 4, 16, seed = 2)
+  results = multistart(model.objective, starts, constraints = model.constraints, workers = 4)
+  best = results[0]
+  print(f"best of {len(results)}: start {best.start}, loss = {best.loss:.4f} at {[ round(p, 2) for p in best.parameters ]}")
+
+if __name__ == "__main__":
+  main()
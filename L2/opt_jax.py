@@ -1,15 +1,18 @@
 # Now we will do all of that, but with JAX to do the heavy lifting.
 
-from jax import jit, grad
 from scipy import optimize
+from point_cache import ValueAndGradCache
+from jax_cache import jitted
 
 # Still the same objective functions!
 from objectives import distance_to_point, linear_regression
 
 def call_scipy(f, initial_parameters): 
-  forward = jit(f)
-  derivative = jit(grad(f))
-  result = optimize.minimize(forward, initial_parameters, jac = derivative, method = "SLSQP")
+  # One compiled function for both the value and the gradient, and a cache so
+  # that SciPy's `fun` and `jac` callbacks at the same point share one call.
+  # Compiled once per function and input shape, not once per call (see jax_cache.py).
+  cache = ValueAndGradCache(jitted(f))
+  result = optimize.minimize(cache.fun, initial_parameters, jac = cache.jac, method = "SLSQP")
   print(result)
   return [float(x) for x in result.x]
 
@@ -26,4 +29,5 @@ def main():
   a,b,c = result 
   print(f"y = {-a/b:.2f}x + {-c/b:.2f}")
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+  main()
@@ -1,7 +1,8 @@
 # Demonstrate a constrained optimization problem
 
-from jax import jit, grad
 from scipy import optimize
+from point_cache import ValueAndGradCache
+from jax_cache import jitted
 
 # Reuse some library code; written in python.
 from objectives import distance
@@ -43,21 +44,30 @@ def call_scipy(model, initial_parameters, num_constraints):
   # Our actual constraint function has to return an MxN matrix, where 
   # - M is the number of constraints we have
   # - N is the number of parameters we are optimizing over the function. 
-  # We accomplish this by calling "grad" several times. Note that because of
-  # `jit` this function is only called once, which we can verify via print.
-  def c(x):
-    # print("Calling C", x)
-    return [grad(lambda y: model.constraints(y)[i])(x) for i in range(num_constraints)]
-
+  # The "constraints" transform stacks the values and takes their Jacobian with
+  # `jacfwd`, one forward sweep per parameter rather than one `grad` per constraint.
+  #
+  # As for the objective, the constraint values and their Jacobian come out of one
+  # compiled call, cached so that `fun` and `jac` at the same point share it. Both
+  # are compiled once per model method and input shape (see jax_cache.py), so
+  # later calls with the same model skip compilation.
+  values_and_jacobian = jitted(model.constraints, "constraints")
+  def checked(x):
+    values, jacobian = values_and_jacobian(x)
+    if len(values) != num_constraints:
+      raise ValueError(f"expected {num_constraints} constraints, got {len(values)}")
+    return values, jacobian
+  constraint_cache = ValueAndGradCache(checked)
   constraints = {
     "type": "ineq",
-    "fun": jit(model.constraints), 
-    "jac": jit(c) # Comment out this line to see what happens without constraint gradients...
+    "fun": constraint_cache.fun, 
+    "jac": constraint_cache.jac # Comment out this line to see what happens without constraint gradients...
   }
 
-  result = optimize.minimize(jit(objective), 
+  objective_cache = ValueAndGradCache(jitted(objective))
+  result = optimize.minimize(objective_cache.fun, 
                             initial_parameters, 
-                            jac = jit(grad(objective)), 
+                            jac = objective_cache.jac, 
                             constraints = constraints,
                             method = "SLSQP")
   print(result)
@@ -69,6 +79,5 @@ def main():
   result = call_scipy(Model(), initial_parameters, 2)
   print("final parameters:", result)
 
-
-
-main()
\ No newline at end of file
+if __name__ == "__main__":
+  main()
@@ -1,8 +1,11 @@
 # Calling Scipy for optimization instead of our home-grown gradient descent
 
-from optimization import forward_gradient, Variable
+from optimization import forward_gradient
+from forward import Variable
 from typing import List
 from scipy import optimize
+from tracing import compile
+from point_cache import ValueAndGradCache
 
 # Re-use the same code.
 from objectives import distance_to_point, linear_regression
@@ -16,8 +19,16 @@ def grad(f):
     return forward_gradient(result_node, variables)
   return g
 
-def call_scipy(f, initial_parameters: List[float]): 
-  result = optimize.minimize(f, initial_parameters, jac = grad(f), method = "SLSQP")
+# Methods that can use Hessian-vector products
+HESSP_METHODS = ["Newton-CG", "trust-ncg", "trust-krylov", "trust-constr"]
+
+def call_scipy(f, initial_parameters: List[float], method: str = "SLSQP"): 
+  # Trace f once and let SciPy replay the same graph at every point it asks for.
+  objective = compile(f, len(initial_parameters))
+  # `fun` and `jac` at the same point share one value_and_grad sweep
+  cache = ValueAndGradCache(objective.value_and_grad)
+  hessp = objective.hvp if method in HESSP_METHODS else None
+  result = optimize.minimize(cache.fun, initial_parameters, jac = cache.jac, hessp = hessp, method = method)
   return [float(x) for x in result.x]
 
 def main(): 
@@ -33,5 +44,11 @@ def main():
   a,b,c = result 
   print(f"y = {-a/b:.2f}x + {-c/b:.2f}")
 
+  print("\n -- Linear Regression (Newton-CG) -- ")
+  result = call_scipy(linear_regression, initial_parameters, method = "Newton-CG")
+  print("final parameters:", result)
+  a,b,c = result 
+  print(f"y = {-a/b:.2f}x + {-c/b:.2f}")
+
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -1,18 +1,12 @@
+import numpy as np
 from typing import List
-from forward import partial, Variable
+from forward import vector_gradient
 from objectives import distance_to_point, linear_regression
+from tracing import compile
 
-# Compute the gradient [dResult / dInput_0 , ... dResult / dInput_n ]
+# Compute the gradient [dResult / dInput_0 , ... dResult / dInput_n ] in a single vector sweep
 def forward_gradient(result_node, inputs): 
-  gradient = []
-  for input in inputs: 
-    for other in inputs: 
-      if other == input: 
-        other.set_partial(1.0)
-      else:
-        other.set_partial(0.0)
-    gradient.append(partial(result_node))
-  return gradient
+  return vector_gradient(result_node, *inputs)
 
 # Lift the function F to a new function that takes the same arguments and returns the gradient.
 def grad(f): 
@@ -21,25 +15,51 @@ def grad(f):
     return forward_gradient(result_node, inputs)
   return g
 
-def optimize(f, initial_parameters: List[float]): 
+# What each method asks of its objective (besides counting `evaluations`).
+REQUIRES = {
+  "gradient-descent": ["value_and_grad"],
+  "newton-cg": ["value_and_grad", "eval", "hvp"],
+  "lbfgs": ["value_and_grad"],
+  "sgd": ["value_and_grad", "sample"],
+}
+
+def optimize(f, initial_parameters: List[float], method: str = "gradient-descent", batch_size: int = 256): 
+  if method not in REQUIRES:
+    raise ValueError(f"unknown method: {method}")
+  if hasattr(f, "value_and_grad"):
+    objective = f # Already an objective, e.g. over a dataset (see dataset.py)
+  else:
+    # Trace f once; every step below only re-propagates values through that graph.
+    objective = compile(f, len(initial_parameters))
+  missing = [ name for name in REQUIRES[method] if not hasattr(objective, name) ]
+  if missing:
+    raise ValueError(f"{method} needs an objective with {', '.join(missing)}, which {type(objective).__name__} does not have")
+  if method == "gradient-descent":
+    parameters = gradient_descent(objective, initial_parameters)
+  elif method == "newton-cg":
+    parameters = newton_cg(objective, initial_parameters)
+  elif method == "lbfgs":
+    parameters = lbfgs(objective, initial_parameters)
+  else:
+    parameters = sgd(objective, initial_parameters, batch_size) # e.g. over a dataset (see dataset.py)
+  print("evaluations:", dict(objective.evaluations))
+  return parameters
+
+def gradient_descent(objective, initial_parameters: List[float]): 
   step_size = 0.1
   max_steps = 10000
   num_steps = 0 
 
-  g = grad(f)
   parameters = list(initial_parameters)
-  variables = [ Variable(f"x_{i}", p) for (i, p) in enumerate(initial_parameters) ] 
-  loss = f(parameters)
+  loss, gradient = objective.value_and_grad(parameters)
 
   # Iterate in the direction of the negative gradient until we converge
   while loss >= 1e-3 and num_steps < max_steps: 
-    gradient = g(variables)
     for i in range(len(gradient)): 
       parameters[i] = parameters[i] - (gradient[i] * step_size)
-      variables[i].value = parameters[i]
 
     # Check if we're still doing anything
-    next_loss = f(parameters)
+    next_loss, next_gradient = objective.value_and_grad(parameters)
     if abs(next_loss - loss) <= 1e-3:
       break
 
@@ -47,6 +67,7 @@ def optimize(f, initial_parameters: List[float]):
     num_steps += 1
     if num_steps % 10 == 0: 
       print(f"[step {num_steps}] loss = {loss}, gradient = {gradient}")
+    gradient = next_gradient
   
   # Lots of additional things we could do here: 
   # - Try several step sizes at each gradient iteration (line-search)
@@ -55,6 +76,184 @@ def optimize(f, initial_parameters: List[float]):
 
   return parameters
 
+# Approximately solve H·p = b with conjugate gradients, touching H only through
+# Hessian-vector products. Stops early once the residual is small relative to b
+# or when it finds a direction of non-positive curvature.
+def conjugate_gradient(hvp, b, max_iterations: int):
+  x = np.zeros_like(b)
+  r = b.copy()
+  d = r.copy()
+  rr = r @ r
+  tolerance = min(0.5, np.sqrt(np.sqrt(rr))) * np.sqrt(rr)
+  for i in range(max_iterations):
+    Hd = hvp(d)
+    curvature = d @ Hd
+    if curvature <= 0:
+      return x if i > 0 else b # Not convex here: fall back to the gradient direction
+    alpha = rr / curvature
+    x = x + alpha * d
+    r = r - alpha * Hd
+    next_rr = r @ r
+    if np.sqrt(next_rr) <= tolerance:
+      break
+    d = r + (next_rr / rr) * d
+    rr = next_rr
+  return x
+
+# Newton-CG: step along the (approximate) Newton direction -H⁻¹g, found with
+# conjugate gradients on Hessian-vector products, so H is never materialized.
+def newton_cg(objective, initial_parameters: List[float]): 
+  max_steps = 100
+  x = np.array(initial_parameters, dtype = float)
+  loss, gradient = objective.value_and_grad(x)
+  gradient = np.array(gradient)
+  for num_steps in range(1, max_steps + 1): 
+    if np.linalg.norm(gradient) <= 1e-8:
+      break
+    direction = conjugate_gradient(lambda v: objective.hvp(x, v), -gradient, 10 * len(x))
+
+    # Backtrack until the step decreases the loss enough (Armijo condition)
+    t = 1.0
+    slope = gradient @ direction
+    while objective.eval(x + t * direction) > loss + 1e-4 * t * slope and t > 1e-10:
+      t *= 0.5
+    x = x + t * direction
+
+    next_loss, gradient = objective.value_and_grad(x)
+    gradient = np.array(gradient)
+    converged = abs(next_loss - loss) <= 1e-12 * max(1.0, abs(loss))
+    loss = next_loss
+    print(f"[step {num_steps}] loss = {loss}, |gradient| = {np.linalg.norm(gradient)}")
+    if converged:
+      break
+  return [ float(p) for p in x ]
+
+# L-BFGS two-loop recursion: apply the inverse Hessian approximation built from
+# the last `count` (s, y) pairs, stored in ring buffers S and Y, to the gradient.
+def two_loop(gradient, S, Y, rho, count: int):
+  memory = S.shape[0]
+  stored = min(count, memory)
+  q = gradient.copy()
+  alpha = np.empty(stored)
+  for i in range(stored): # Newest to oldest
+    k = (count - 1 - i) % memory
+    alpha[i] = rho[k] * (S[k] @ q)
+    q -= alpha[i] * Y[k]
+  if stored > 0:
+    newest = (count - 1) % memory
+    q *= (S[newest] @ Y[newest]) / (Y[newest] @ Y[newest])
+  for i in reversed(range(stored)): # Oldest to newest
+    k = (count - 1 - i) % memory
+    beta = rho[k] * (Y[k] @ q)
+    q += (alpha[i] - beta) * S[k]
+  return q
+
+# Find a step t along `direction` satisfying the strong Wolfe conditions
+# (sufficient decrease, and a small enough slope), following Nocedal & Wright's
+# bracket-then-zoom scheme. Every trial point costs one value_and_grad: the value
+# comes out of the same sweep as the gradient. Returns t, the loss and gradient there.
+def wolfe_line_search(value_and_grad, x, loss, gradient, direction, t=1.0, c1=1e-4, c2=0.9, max_trials=30):
+  slope = gradient @ direction
+  trials = 0
+
+  def evaluate(t):
+    nonlocal trials
+    trials += 1
+    trial_loss, trial_gradient = value_and_grad(x + t * direction)
+    return trial_loss, trial_gradient, trial_gradient @ direction
+
+  def zoom(lo, lo_loss, lo_slope, hi, hi_loss):
+    while True:
+      # Minimize the quadratic through (lo, lo_loss, lo_slope) and (hi, hi_loss),
+      # falling back to bisection when that lands too close to either end.
+      width = hi - lo
+      curvature = hi_loss - lo_loss - lo_slope * width
+      t = lo - lo_slope * width * width / (2 * curvature) if curvature > 0 else lo + width / 2
+      if not (min(lo, hi) + 0.1 * abs(width) <= t <= max(lo, hi) - 0.1 * abs(width)):
+        t = lo + width / 2
+      t_loss, t_gradient, t_slope = evaluate(t)
+      if trials >= max_trials:
+        return t, t_loss, t_gradient
+      if t_loss > loss + c1 * t * slope or t_loss >= lo_loss:
+        hi, hi_loss = t, t_loss
+      else:
+        if abs(t_slope) <= -c2 * slope:
+          return t, t_loss, t_gradient
+        if t_slope * (hi - lo) >= 0:
+          hi, hi_loss = lo, lo_loss
+        lo, lo_loss, lo_slope = t, t_loss, t_slope
+
+  previous, previous_loss, previous_slope = 0.0, loss, slope
+  while True:
+    t_loss, t_gradient, t_slope = evaluate(t)
+    if trials >= max_trials:
+      return t, t_loss, t_gradient
+    if t_loss > loss + c1 * t * slope or (trials > 1 and t_loss >= previous_loss):
+      return zoom(previous, previous_loss, previous_slope, t, t_loss)
+    if abs(t_slope) <= -c2 * slope:
+      return t, t_loss, t_gradient
+    if t_slope >= 0:
+      return zoom(t, t_loss, t_slope, previous, previous_loss)
+    previous, previous_loss, previous_slope = t, t_loss, t_slope
+    t *= 2
+
+# Limited-memory BFGS: a quasi-Newton method that builds its curvature estimate
+# from the last `memory` steps and gradient changes only. With a Wolfe line
+# search, it needs no step size tuning and far fewer evaluations than plain
+# gradient descent.
+def lbfgs(objective, initial_parameters: List[float], memory: int = 10): 
+  max_steps = 1000
+  x = np.array(initial_parameters, dtype = float)
+  n = len(x)
+  S = np.zeros((memory, n))
+  Y = np.zeros((memory, n))
+  rho = np.zeros(memory)
+  count = 0
+
+  def value_and_grad(x):
+    value, gradient = objective.value_and_grad(x)
+    return value, np.array(gradient, dtype = float)
+
+  loss, gradient = value_and_grad(x)
+  for num_steps in range(1, max_steps + 1): 
+    if np.linalg.norm(gradient) <= 1e-8:
+      break
+    direction = -two_loop(gradient, S, Y, rho, count)
+    if gradient @ direction >= 0:
+      direction = -gradient # Lost descent (e.g. round-off): restart from steepest descent
+    # Without curvature information yet, start with a step of length 1
+    t = 1.0 if count > 0 else min(1.0, 1.0 / np.linalg.norm(gradient))
+    t, next_loss, next_gradient = wolfe_line_search(value_and_grad, x, loss, gradient, direction, t)
+
+    s = t * direction
+    y = next_gradient - gradient
+    if s @ y > 1e-10 * np.linalg.norm(s) * np.linalg.norm(y):
+      k = count % memory
+      S[k], Y[k], rho[k] = s, y, 1.0 / (s @ y)
+      count += 1
+
+    converged = abs(next_loss - loss) <= 1e-12 * max(1.0, abs(loss))
+    x, loss, gradient = x + s, next_loss, next_gradient
+    if num_steps % 10 == 0 or converged: 
+      print(f"[step {num_steps}] loss = {loss}, |gradient| = {np.linalg.norm(gradient)}")
+    if converged:
+      break
+  return [ float(p) for p in x ]
+
+# Stochastic gradient descent (with momentum), for objectives over datasets: each
+# step follows the gradient on a random minibatch of `batch_size` rows instead of
+# the whole dataset, so a step costs the same however much data there is.
+def sgd(objective, initial_parameters: List[float], batch_size: int = 256, step_size: float = 0.01, momentum: float = 0.9, max_steps: int = 1000): 
+  x = np.array(initial_parameters, dtype = float)
+  velocity = np.zeros_like(x)
+  for num_steps in range(1, max_steps + 1): 
+    loss, gradient = objective.value_and_grad(x, objective.sample(batch_size))
+    velocity = momentum * velocity - step_size * np.asarray(gradient)
+    x = x + velocity
+    if num_steps % 100 == 0: 
+      print(f"[step {num_steps}] minibatch loss = {loss}")
+  return [ float(p) for p in x ]
+
 def main(): 
   print("\n -- Distance to Point -- ")
   initial_parameters = [-10, 10]
@@ -68,5 +267,17 @@ def main():
   a,b,c = result 
   print(f"y = {-a/b:.2f}x + {-c/b:.2f}")
 
+  print("\n -- Linear Regression (Newton-CG) -- ")
+  result = optimize(linear_regression, initial_parameters, method = "newton-cg")
+  print("final parameters:", result)
+  a,b,c = result 
+  print(f"y = {-a/b:.2f}x + {-c/b:.2f}")
+
+  print("\n -- Linear Regression (L-BFGS) -- ")
+  result = optimize(linear_regression, initial_parameters, method = "lbfgs")
+  print("final parameters:", result)
+  a,b,c = result 
+  print(f"y = {-a/b:.2f}x + {-c/b:.2f}")
+
 if __name__ == "__main__":
   main()
\ No newline at end of file
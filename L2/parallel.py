@@ -0,0 +1,243 @@
+# Forward mode on many cores
+#
+# Each input's tangent sweep is independent of the others, so the gradient of a
+# function with many inputs splits into blocks of tangent directions that can be
+# swept in parallel. The GIL keeps threads from helping, so we use processes: the
+# traced graph is encoded once into a few compact, picklable arrays and handed to
+# every worker of a pool as it starts. After that, each call only sends the
+# point x and a block of inputs, and gets back that block of the gradient.
+#
+# For the blocks to pay off, a worker's time has to grow with the width of its
+# block, not with the size of the graph: a Python loop over every node costs the
+# same at any width, and capped the speedup near 3x. So a sweep runs level by
+# level instead (a node's level is the longest path from a leaf to it): all the
+# Adds (Muls, ...) of a level are one numpy operation over the rows of their
+# operands in a (nodes x width) matrix of tangents, and fused Sum, SumOfSquares
+# and Dot nodes are one segmented sum each. The Python overhead then grows with
+# the depth of the graph, which is why we trace with `simplify` on by default:
+# flattening turns accumulation chains, as deep as the loop that built them,
+# into single Sums. Blocks are swept `chunk` tangent directions at a time, to
+# bound the matrix's memory.
+#
+# As with tracing.py, control flow is frozen at the point the graph was traced.
+import os
+import weakref
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from forward import Add, Sub, Mul, Div, Sum, SumOfSquares, Dot
+from tracing import Compiled
+
+# Opcodes, as in tape.py
+ADD, SUB, MUL, DIV, SUM, SQUARES, DOT = range(7)
+OPCODES = { Add: ADD, Sub: SUB, Mul: MUL, Div: DIV, Sum: SUM, SumOfSquares: SQUARES, Dot: DOT }
+
+# The graph as arrays. Slots hold the leaves, then each level's nodes, grouped by
+# opcode; a step computes one group into the slots [lo, hi) from:
+#  - ADD ... DIV: the slots of their two parents (lhs, rhs);
+#  - SUM, SQUARES: the slots of all their terms, and where each node's start (offsets);
+#  - DOT: the slots of the left and right halves of their pairs, and offsets.
+class Graph():
+  def __init__(self, order, inputs, chunk: int = 128):
+    self.chunk = chunk
+    leaves = [ node for node in order if len(node.parents) == 0 ]
+    slot = { node: i for (i, node) in enumerate(leaves) }
+    self.leaves = np.array([ float(node.value) for node in leaves ])
+    levels = {}
+    groups = {} # level -> opcode -> nodes
+    for node in order:
+      if len(node.parents) == 0:
+        levels[node] = 0
+        continue
+      op = OPCODES.get(type(node))
+      if op is None:
+        raise TypeError(f"cannot encode {type(node).__name__} nodes")
+      levels[node] = 1 + max(levels[parent] for parent in node.parents)
+      groups.setdefault(levels[node], {}).setdefault(op, []).append(node)
+
+    self.steps = [] # (opcode, lo, hi, index arrays), level by level
+    for level in sorted(groups):
+      for (op, nodes) in sorted(groups[level].items()):
+        if op < SUM:
+          arrays = (np.array([ slot[node.parents[0]] for node in nodes ]),
+                    np.array([ slot[node.parents[1]] for node in nodes ]))
+        else:
+          terms = [ list(node.pairs()) if op == DOT else node.parents for node in nodes ]
+          offsets = np.cumsum([0] + [ len(node_terms) for node_terms in terms[:-1] ])
+          if op == DOT:
+            arrays = (np.array([ slot[a] for node_terms in terms for (a, _) in node_terms ]),
+                      np.array([ slot[b] for node_terms in terms for (_, b) in node_terms ]), offsets)
+          else:
+            arrays = (np.array([ slot[term] for node_terms in terms for term in node_terms ]), offsets)
+        lo = len(slot)
+        for node in nodes:
+          slot[node] = len(slot)
+        self.steps.append((op, lo, len(slot), arrays))
+    self.size = len(slot)
+    self.result = slot[order[-1]]
+    # Where each input sits (-1 if the result does not depend on it)
+    self.inputs = np.array([ slot.get(input, -1) for input in inputs ], dtype = int)
+
+  def evaluate(self, x):
+    values = np.empty(self.size)
+    values[:len(self.leaves)] = self.leaves
+    used = self.inputs >= 0
+    values[self.inputs[used]] = np.asarray(x, dtype = float)[used]
+    for (op, lo, hi, arrays) in self.steps:
+      if op < SUM:
+        a, b = values[arrays[0]], values[arrays[1]]
+        values[lo:hi] = a + b if op == ADD else a - b if op == SUB else a * b if op == MUL else a / b
+      elif op == SUM:
+        values[lo:hi] = np.add.reduceat(values[arrays[0]], arrays[1])
+      elif op == SQUARES:
+        terms = values[arrays[0]]
+        values[lo:hi] = np.add.reduceat(terms * terms, arrays[1])
+      else:
+        values[lo:hi] = np.add.reduceat(values[arrays[0]] * values[arrays[1]], arrays[2])
+    return values
+
+  # Tangents of every slot for inputs [start, stop), given the VALUES of every slot
+  def tangents(self, values, start, stop):
+    tangents = np.empty((self.size, stop - start)) # Every step writes its rows: only leaves need zeroing
+    tangents[:len(self.leaves)] = 0.0
+    for i in range(start, stop):
+      if self.inputs[i] >= 0:
+        tangents[self.inputs[i], i - start] += 1.0
+    for (op, lo, hi, arrays) in self.steps:
+      out = tangents[lo:hi] # Results are written in place, to spare temporaries
+      if op < SUM:
+        a, b = arrays
+        if op == ADD:
+          np.add(tangents[a], tangents[b], out = out)
+        elif op == SUB:
+          np.subtract(tangents[a], tangents[b], out = out)
+        elif op == MUL:
+          np.multiply(tangents[b], values[a, None], out = out)
+          out += tangents[a] * values[b, None]
+        else:
+          vb = values[b, None]
+          np.multiply(tangents[a], vb, out = out)
+          out -= values[a, None] * tangents[b]
+          out /= vb * vb
+      elif op == SUM:
+        np.add.reduceat(tangents[arrays[0]], arrays[1], axis = 0, out = out)
+      elif op == SQUARES:
+        terms = arrays[0]
+        np.add.reduceat(2 * values[terms, None] * tangents[terms], arrays[1], axis = 0, out = out)
+      else:
+        a, b, offsets = arrays
+        np.add.reduceat(tangents[a] * values[b, None] + values[a, None] * tangents[b], offsets, axis = 0, out = out)
+    return tangents[self.result]
+
+  # Value of the result at X, along with its tangents for inputs [start, stop)
+  def sweep(self, x, start, stop):
+    values = self.evaluate(x)
+    tangents = [ self.tangents(values, lo, min(lo + self.chunk, stop)) for lo in range(start, stop, self.chunk) ]
+    return float(values[self.result]), np.concatenate(tangents) if tangents else np.zeros(0)
+
+# Each worker process keeps the graph it was started with.
+worker_graph = None
+
+def install(graph):
+  global worker_graph
+  worker_graph = graph
+
+def sweep_block(x, start, stop):
+  return worker_graph.sweep(x, start, stop)
+
+class ParallelGradient():
+  def __init__(self, f, n_inputs: int, workers: int = None, block_size: int = None, simplify: bool = True):
+    self.traced = Compiled(f, n_inputs, simplify)
+    self.n_inputs = n_inputs
+    self.workers = workers or os.cpu_count() or 1
+    # By default, one block of inputs per worker
+    self.block_size = block_size or -(-n_inputs // self.workers)
+    self.evaluations = Counter()
+    self.pool = None # Started at the first call, once there is a graph to send
+
+  def start(self, x):
+    self.traced.set_inputs(x) # Traces the graph
+    self.graph = Graph(self.traced.order, self.traced.inputs)
+    self.pool = ProcessPoolExecutor(self.workers, initializer = install, initargs = (self.graph,))
+    # Shut the workers down when we are collected, if `close` was not called
+    self.finalizer = weakref.finalize(self, self.pool.shutdown)
+
+  def eval(self, x):
+    self.evaluations["value"] += 1
+    return self.traced.eval(x)
+
+  def value_and_grad(self, x):
+    self.evaluations["value_and_grad"] += 1
+    if len(x) != self.n_inputs:
+      raise ValueError(f"expected {self.n_inputs} inputs, got {len(x)}")
+    blocks = [ (start, min(start + self.block_size, self.n_inputs)) for start in range(0, self.n_inputs, self.block_size) ]
+    if len(blocks) == 1: # Nothing to split: sweep here, without a pool
+      return self.traced.value_and_grad(x)
+    if self.pool is None:
+      self.start(x)
+    x = [ float(v) for v in x ]
+    futures = [ self.pool.submit(sweep_block, x, start, stop) for (start, stop) in blocks ]
+    value, gradient = 0.0, []
+    for future in futures:
+      value, tangents = future.result()
+      gradient.extend(tangents.tolist())
+    return value, gradient
+
+  def grad(self, x):
+    return self.value_and_grad(x)[1]
+
+  __call__ = eval
+
+  # Shut the workers down; they are otherwise kept for as long as we are.
+  def close(self):
+    if self.pool is not None:
+      self.finalizer()
+      self.pool = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+# Like tracing.compile, with gradients computed by a pool of `workers` processes.
+def parallel_grad(f, n_inputs: int, workers: int = None, block_size: int = None, simplify: bool = True):
+  return ParallelGradient(f, n_inputs, workers, block_size, simplify)
+
+def main():
+  from timeit import default_timer as timer
+  from tracing import compile
+
+  def rosenbrock(args):
+    total = 0
+    for i in range(len(args) - 1):
+      d = args[i + 1] - args[i] * args[i]
+      e = 1 - args[i]
+      total += 100 * d * d + e * e
+    return total
+
+  n = 2000
+  x = [ -1.0 + 0.001 * i for i in range(n) ]
+  serial = compile(rosenbrock, n)
+  serial.value_and_grad(x) # Trace outside of the timings
+  start = timer()
+  value, gradient = serial.value_and_grad(x)
+  print(f"serial: {(timer() - start) * 1e3:.2f}ms")
+
+  workers = max(os.cpu_count() or 1, 2)
+  with parallel_grad(rosenbrock, n, workers) as objective:
+    objective.value_and_grad(x) # Trace, and start the workers
+    start = timer()
+    parallel_value, parallel_gradient = objective.value_and_grad(x)
+    print(f"parallel ({workers} workers): {(timer() - start) * 1e3:.2f}ms")
+  print("value difference:", abs(parallel_value - value), "max gradient difference:", max(abs(a - b) for (a, b) in zip(gradient, parallel_gradient)))
+
+  # What one worker pays for a block grows with its width, so k workers take ~1/k of the time
+  graph = objective.graph
+  for width in [n, n // 8, n // 64, 1]:
+    start = timer()
+    graph.sweep(x, 0, width)
+    print(f"one block of width {width}: {(timer() - start) * 1e3:.2f}ms")
+
+if __name__ == "__main__":
+  main()
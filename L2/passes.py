@@ -0,0 +1,217 @@
+# Graph rewriting passes
+#
+# These work on graphs from either engine (forward.py or reverse.py): a pass
+# takes the result node of a graph and returns the result node of an equivalent
+# graph, along with statistics about what it rewrote. Rewritten nodes are rebuilt
+# with `type(node)(*parents)`, so the new graph is made of the same engine's
+# nodes. Variables are never rebuilt, so gradients are still taken with respect
+# to the original inputs.
+import sys
+import numpy as np
+from collections import Counter
+
+def engine(node):
+  return sys.modules[type(node).__module__]
+
+# Parents before children, like forward.order_nodes.
+def topological_order(result):
+  order = []
+  visited = set()
+  stack = [(result, False)]
+  while len(stack) != 0:
+    node, expanded = stack.pop()
+    if expanded:
+      order.append(node)
+    elif node not in visited:
+      visited.add(node)
+      stack.append((node, True))
+      for parent in reversed(node.parents):
+        stack.append((parent, False))
+  return order
+
+def rebuild(node, parents):
+  if all(p is q for (p, q) in zip(parents, node.parents)):
+    return node # Nothing changed underneath this node, keep it
+  return type(node)(*parents)
+
+# Common subexpression elimination: identical operations on identical (shared)
+# parents, and constants with identical values, are collapsed into one node.
+def cse(result):
+  Constant = engine(result).Constant
+  stats = Counter()
+  canonical = {} # node -> the node that replaces it
+  table = {} # structural key -> node
+  for node in topological_order(result):
+    stats["nodes"] += 1
+    parents = [ canonical[parent] for parent in node.parents ]
+    if isinstance(node, Constant) and isinstance(node.value, (int, float)):
+      key = (Constant, repr(node.value))
+    elif len(parents) == 0:
+      canonical[node] = node # Variables (and array constants) are unique
+      continue
+    else:
+      key = engine(result).structural_key(type(node), tuple(id(parent) for parent in parents))
+    if key in table:
+      canonical[node] = table[key]
+      stats["shared"] += 1
+    else:
+      canonical[node] = table[key] = rebuild(node, parents)
+  return canonical[result], stats
+
+def is_constant(node, Constant, value=None):
+  if not isinstance(node, Constant):
+    return False
+  return value is None or (np.ndim(node.value) == 0 and node.value == value)
+
+# Constant folding and algebraic simplification: operations on constants only are
+# folded into a single constant, and the identities x+0, 0+x, x-0, x*1, 1*x, x/1
+# and the annihilators x*0, 0*x, 0/x are rewritten away. The annihilators assume
+# x is finite, as 0*inf and 0*nan are not 0.
+def simplify(result):
+  Constant = engine(result).Constant
+  stats = Counter()
+  replaced = {} # node -> the node that replaces it
+  for node in topological_order(result):
+    stats["nodes"] += 1
+    parents = [ replaced[parent] for parent in node.parents ]
+    replaced[node] = rewrite(node, parents, Constant, stats)
+  return replaced[result], stats
+
+def rewrite(node, parents, Constant, stats):
+  if len(parents) == 0:
+    return node
+  if all(is_constant(parent, Constant) for parent in parents):
+    stats["folded"] += 1
+    return Constant(node.value)
+  name = type(node).__name__
+  if len(parents) == 2:
+    a, b = parents
+    zero = lambda n: is_constant(n, Constant, 0)
+    one = lambda n: is_constant(n, Constant, 1)
+    if (name == "Add" and zero(a)) or (name == "Mul" and one(a)):
+      stats["identity"] += 1
+      return b
+    if (name in ("Add", "Sub") and zero(b)) or (name in ("Mul", "Div") and one(b)):
+      stats["identity"] += 1
+      return a
+    if (name == "Mul" and (zero(a) or zero(b))) or (name == "Div" and zero(a)):
+      stats["annihilated"] += 1
+      return Constant(np.zeros_like(node.value) if np.ndim(node.value) else 0.0) # Keep array shapes
+  return rebuild(node, parents)
+
+# Flattening accumulation chains: `total = total + term` in a loop builds a
+# left-deep chain of Adds, one node (and one step of depth) per term. A tree of
+# scalar Adds (and Sums) whose inner nodes have no other use is collapsed into a
+# single n-ary Sum over its terms. Among those terms, squares x*x used nowhere
+# else are gathered into one SumOfSquares, and other products a*b into one Dot.
+# Inner nodes used elsewhere are kept, and stay terms of the node using them.
+def flatten(result):
+  E = engine(result)
+  stats = Counter()
+  order = topological_order(result)
+  uses = Counter(parent for node in order for parent in node.parents)
+  summing = lambda node: type(node) in (E.Add, E.Sum) and np.ndim(node.value) == 0
+  absorbed = set() # Inner nodes of a tree, folded into the node at its root
+  for node in order:
+    if summing(node):
+      absorbed.update(parent for parent in node.parents if summing(parent) and uses[parent] == 1)
+  replaced = {} # node -> the node that replaces it
+  for node in order:
+    stats["nodes"] += 1
+    if node in absorbed:
+      continue
+    if not summing(node):
+      replaced[node] = rebuild(node, [ replaced[parent] for parent in node.parents ])
+      continue
+    terms = []
+    pending = list(reversed(node.parents))
+    while pending:
+      term = pending.pop()
+      if term in absorbed:
+        pending.extend(reversed(term.parents))
+      else:
+        terms.append(term)
+    # Products of scalars that only this sum uses
+    fusable = lambda term: type(term) is E.Mul and uses[term] == 1 and np.ndim(term.value) == 0
+    squares = [ term for term in terms if fusable(term) and term.parents[0] is term.parents[1] ]
+    products = [ term for term in terms if fusable(term) and term.parents[0] is not term.parents[1] ]
+    squares = squares if len(squares) > 1 else []
+    products = products if len(products) > 1 else []
+    fused = { *squares, *products }
+    if len(terms) <= 2 and len(fused) == 0 and all(parent not in absorbed for parent in node.parents):
+      replaced[node] = rebuild(node, [ replaced[parent] for parent in node.parents ])
+      continue
+    pieces = [ replaced[term] for term in terms if term not in fused ]
+    if squares:
+      pieces.append(E.SumOfSquares(*(replaced[term.parents[0]] for term in squares)))
+    if products:
+      lefts = [ replaced[term.parents[0]] for term in products ]
+      rights = [ replaced[term.parents[1]] for term in products ]
+      pieces.append(E.Dot(*lefts, *rights))
+    # A lone array term still needs summing, as the absorbed nodes did
+    replaced[node] = pieces[0] if len(pieces) == 1 and np.ndim(pieces[0].value) == 0 else E.Sum(*pieces)
+    stats["flattened"] += len(terms) - 1 + len(fused) # Binary nodes now covered by fused ones
+  return replaced[result], stats
+
+# Everything we have, as run on traced objectives: simplify first, as folding
+# constants can expose more structurally identical nodes to share, and flatten
+# last, once every use of a shared node is known. With `fuse=False`, the graph
+# keeps to the binary Add, Sub, Mul and Div nodes (for consumers handling no other).
+def optimize(result, fuse: bool = True):
+  simplified, stats = simplify(result)
+  shared, more = cse(simplified)
+  stats.update(shared = more["shared"])
+  if fuse:
+    shared, more = flatten(shared)
+    stats.update(flattened = more["flattened"])
+  return shared, stats
+
+def main():
+  import forward
+  import reverse
+  from objectives import linear_regression
+  from profiler import graph_stats
+
+  # As a pass over an existing graph
+  args = [ forward.Variable(f"x_{i}", p) for (i, p) in enumerate([1, 1, 0]) ]
+  result = linear_regression(args)
+  shared, stats = cse(result)
+  print("cse:", dict(stats), "->", len(topological_order(shared)), "nodes")
+  print("gradient before:", forward.vector_gradient(result, *args))
+  print("gradient after:", forward.vector_gradient(shared, *args))
+
+  # Or while building the graph in the first place
+  args = [ reverse.Variable(f"x_{i}", p) for (i, p) in enumerate([1, 1, 0]) ]
+  with reverse.interning():
+    result = linear_regression(args)
+  print("interned:", len(topological_order(result)), "nodes, gradient:", reverse.reverse_gradient(result, *args))
+
+  # Fold away the `total = 0` the loop in linear_regression starts from, and friends
+  x = forward.Variable("x", 3)
+  result = (x * 1) + (forward.Constant(2) * 3) + (x / 1) * 0 + 0
+  simplified, stats = simplify(result)
+  print("simplify:", dict(stats), "->", len(topological_order(simplified)), "nodes, value:", simplified.value)
+
+  # Collapse the accumulation chain of a sum of squared residuals
+  args = [ reverse.Variable(f"x_{i}", 0.01 * i) for i in range(100) ]
+  result = 0
+  for i in range(99):
+    d = args[i + 1] - args[i]
+    result = result + d * d
+  flat, stats = flatten(result)
+  before, after = graph_stats(result), graph_stats(flat)
+  print("flatten:", dict(stats), "->", after["nodes"], "nodes, depth", before["depth"], "->", after["depth"])
+  print("same gradient:", np.allclose(reverse.reverse_gradient(result, *args), reverse.reverse_gradient(flat, *args)))
+
+  # A sum absorbed into a root left with too few terms to fuse: `(a*a).sum() + b`
+  for engine in [forward, reverse]:
+    a = engine.Variable("a", np.array([1.0, 2.0, 3.0]))
+    b = engine.Variable("b", 4.0)
+    for result in [(a * a).sum() + b, engine.Sum((a * a).sum()), engine.Sum(a.sum()) + b]:
+      flat, _ = flatten(result)
+      gradients = [ engine.tensor_gradient(g, a, b) if engine is forward else engine.reverse_gradient(g, a, b) for g in (result, flat) ]
+      same = flat.value == result.value and all(np.allclose(x, y) for (x, y) in zip(*gradients))
+      print(f"flatten {engine.__name__} {type(flat).__name__}:", "same value and gradient" if same else "MISMATCH")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,52 @@
+# Sharing one sweep between SciPy's `fun` and `jac` callbacks
+#
+# scipy.optimize.minimize asks for the objective and its gradient through two
+# separate callbacks, but almost always at the same x, one right after the
+# other. Both come out of a single value_and_grad sweep, so we keep the last few
+# results around, keyed on the raw bytes of x, and answer the second callback
+# from there.
+import numpy as np
+from collections import OrderedDict
+
+class ValueAndGradCache():
+  def __init__(self, value_and_grad, maxsize: int = 4):
+    self.value_and_grad = value_and_grad
+    self.maxsize = maxsize
+    self.entries = OrderedDict() # Least recently used first
+    self.hits = 0
+    self.misses = 0
+
+  def lookup(self, x):
+    x = np.asarray(x, dtype = float)
+    key = (x.shape, x.tobytes())
+    if key in self.entries:
+      self.hits += 1
+      self.entries.move_to_end(key)
+      return self.entries[key]
+    self.misses += 1
+    value, gradient = self.value_and_grad(x)
+    value = float(value) if np.ndim(value) == 0 else np.asarray(value, dtype = float)
+    entry = self.entries[key] = (value, np.asarray(gradient, dtype = float))
+    if len(self.entries) > self.maxsize:
+      self.entries.popitem(last = False)
+    return entry
+
+  def fun(self, x):
+    return self.lookup(x)[0]
+
+  def jac(self, x):
+    return self.lookup(x)[1].copy() # Callers may modify what we give them
+
+def main():
+  from tracing import compile
+  from objectives import linear_regression
+  from scipy import optimize
+
+  objective = compile(linear_regression, 3)
+  cache = ValueAndGradCache(objective.value_and_grad)
+  result = optimize.minimize(cache.fun, [1, 1, 0], jac = cache.jac, method = "SLSQP")
+  print("final parameters:", [float(x) for x in result.x])
+  print(f"callbacks: {result.nfev} fun + {result.njev} jac, sweeps: {cache.misses}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,145 @@
+# Profiling the engines
+#
+# Where does the time go in a slow objective: building nodes in the operator
+# overloads, sorting them in `order_nodes`, or sweeping over them? Inside a
+# `with profile(engine) as p:` block, the constructors and sweep methods of the
+# engine's node classes, and its `order_nodes`, are swapped for versions that
+# count and time themselves; on exit the originals are put back. Outside of a
+# profile block nothing is wrapped, so it costs nothing when disabled.
+#
+# `order_nodes` is swapped on the engine module, so calls through the engine
+# (partial, vector_gradient, reverse_gradient, ...) are timed, but modules that
+# imported it by name before profiling started keep calling the original.
+import sys
+from collections import Counter
+from time import perf_counter
+from passes import topological_order
+
+SWEEP_METHODS = ["forward", "d", "evaluate"]
+
+def node_classes(engine):
+  classes = []
+  pending = [engine.Diff]
+  while pending:
+    cls = pending.pop()
+    classes.append(cls)
+    pending.extend(cls.__subclasses__())
+  return classes
+
+# Accumulates the time spent in one phase. Calls can nest (a `make` runs a
+# constructor, a checkpoint rebuilds its segment inside `d()`), so only the
+# outermost call of the phase is timed, and nothing is counted twice.
+class Phase():
+  def __init__(self):
+    self.seconds = 0.0
+    self.depth = 0
+
+  def wrap(self, function, counter=None, name=None):
+    phase = self
+    def wrapper(*args, **kwargs):
+      if counter is not None:
+        counter[name] += 1
+      if phase.depth > 0:
+        return function(*args, **kwargs)
+      phase.depth += 1
+      start = perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        phase.seconds += perf_counter() - start
+        phase.depth -= 1
+    return wrapper
+
+class profile():
+  def __init__(self, engine):
+    self.engine = engine
+    self.created = Counter() # Nodes built, per type
+    self.swept = Counter()   # Sweep method calls, per type
+    self.calls = Counter()   # Calls to `make` and `order_nodes`
+    self.phases = { "construction": Phase(), "sort": Phase(), "sweep": Phase() }
+    self.patched = []
+
+  def patch(self, owner, attribute, replacement):
+    self.patched.append((owner, attribute, getattr(owner, attribute)))
+    setattr(owner, attribute, replacement)
+
+  def __enter__(self):
+    engine = self.engine
+    construction, sort, sweep = self.phases["construction"], self.phases["sort"], self.phases["sweep"]
+    for cls in node_classes(engine):
+      if "__init__" in cls.__dict__:
+        self.patch(cls, "__init__", construction.wrap(cls.__dict__["__init__"], self.created, cls.__name__))
+      for method in SWEEP_METHODS:
+        if method in cls.__dict__:
+          self.patch(cls, method, sweep.wrap(cls.__dict__[method], self.swept, cls.__name__))
+    self.patch(engine, "make", construction.wrap(engine.make, self.calls, "make"))
+    self.patch(engine, "order_nodes", sort.wrap(engine.order_nodes, self.calls, "order_nodes"))
+    return self
+
+  def __exit__(self, *exc):
+    for (owner, attribute, original) in reversed(self.patched):
+      setattr(owner, attribute, original)
+    self.patched = []
+
+  def times(self):
+    return { name: phase.seconds for (name, phase) in self.phases.items() }
+
+  def report(self):
+    lines = [ f"{name:>12}: {seconds * 1e3:10.3f}ms" for (name, seconds) in self.times().items() ]
+    lines.append(f"{'calls':>12}: " + ", ".join(f"{name} {count}" for (name, count) in self.calls.items()))
+    lines.append(f"{'created':>12}: " + ", ".join(f"{name} {count}" for (name, count) in self.created.most_common()))
+    lines.append(f"{'swept':>12}: " + ", ".join(f"{name} {count}" for (name, count) in self.swept.most_common()))
+    return "\n".join(lines)
+
+# Approximate memory held by one node: the object, its attribute dict, its parents
+# list, and any NumPy arrays (values, partials, adjoints) hanging off it.
+def node_bytes(node):
+  total = sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.parents)
+  for value in node.__dict__.values():
+    total += getattr(value, "nbytes", 0)
+  return total
+
+# Shape of the graph under RESULT: node counts per type, depth (longest path
+# from a leaf), fan-out (how many nodes use each node) and approximate bytes held.
+def graph_stats(result):
+  order = topological_order(result)
+  types = Counter(type(node).__name__ for node in order)
+  depth = {}
+  uses = Counter()
+  for node in order:
+    depth[node] = 1 + max((depth[parent] for parent in node.parents), default = -1)
+    for parent in node.parents:
+      uses[parent] += 1
+  fan_out = [ uses[node] for node in order if node is not result ]
+  return {
+    "nodes": len(order),
+    "types": dict(types),
+    "depth": depth[result],
+    "max_fan_out": max(fan_out, default = 0),
+    "mean_fan_out": sum(fan_out) / len(fan_out) if fan_out else 0.0,
+    "bytes": sum(node_bytes(node) for node in order),
+  }
+
+def main():
+  import forward
+  import reverse
+  from objectives import linear_regression
+
+  with profile(forward) as p:
+    args = [ forward.Variable(f"x_{i}", v) for (i, v) in enumerate([1, 1, 0]) ]
+    result = linear_regression(args)
+    forward.forward_gradient(result, *args)
+  print(" -- forward -- ")
+  print(p.report())
+  print(graph_stats(result))
+
+  with profile(reverse) as p:
+    args = [ reverse.Variable(f"x_{i}", v) for (i, v) in enumerate([1, 1, 0]) ]
+    result = linear_regression(args)
+    reverse.reverse_gradient(result, *args)
+  print(" -- reverse -- ")
+  print(p.report())
+  print(graph_stats(result))
+
+if __name__ == "__main__":
+  main()
@@ -1,61 +1,183 @@
 # Reverse mode Autodiff
+import itertools
+import numpy as np
+from operator import attrgetter
 
 def lift(value): 
   if isinstance(value, Diff):
     return value # Already a node 
+  elif intern_table is not None and isinstance(value, (int, float)):
+    return make(Constant, value)
   else:
     return Constant(value) # Make constant
+
+# Structural interning ("hash-consing"), opt-in: inside a `with interning():` block,
+# building the same operation on the same parents returns the node built the first
+# time, so identical subexpressions collapse into one shared node. The table holds
+# on to every node it returns, so the parent identities in its keys stay valid.
+intern_table = None
+
+class interning():
+  def __enter__(self):
+    global intern_table
+    self.previous = intern_table
+    intern_table = {}
+    return self
+
+  def __exit__(self, *exc):
+    global intern_table
+    intern_table = self.previous
+
+def make(op, *args):
+  if intern_table is None:
+    return op(*args)
+  if op is Constant:
+    key = (op, repr(args[0])) # repr keeps 1 / 1.0 and 0.0 / -0.0 apart
+  else:
+    key = structural_key(op, tuple(id(arg) for arg in args))
+  node = intern_table.get(key)
+  if node is None:
+    node = intern_table[key] = op(*args)
+  return node
+
+# What identifies an operation on parents with identities IDS, for interning (and
+# passes.cse): the parents of a commutative op may come in any order, and those
+# of a Dot in any order of pairs, each of which may be swapped.
+def structural_key(op, ids):
+  if op is Dot:
+    half = len(ids) // 2
+    return (op,) + tuple(sorted(tuple(sorted(pair)) for pair in zip(ids[:half], ids[half:])))
+  if op.commutative:
+    return (op,) + tuple(sorted(ids))
+  return (op,) + ids
   
-# Ancilliary: node ordering requires a topological-sort,
-# which we accomplish using a depth-first search.
+# Ancilliary: node ordering requires a topological-sort. Every node is created
+# after its parents, so the nodes reachable from the result, sorted by creation
+# number, already are one: we only need to find them, marking each node with
+# the number of the search that reached it rather than keeping a visited set.
+creation = itertools.count(1)
+searches = itertools.count(1)
+
+# Orders are cached on the result node; they stay valid for as long as no
+# node's `parents` is modified, as new nodes never change what lies above an
+# existing one. Call `invalidate_orders()` after rewiring a graph in place.
+graph_version = 0
+
+def invalidate_orders():
+  global graph_version
+  graph_version += 1
+
 def order_nodes(node): 
-  order = []
-  permanent = set()
-  temporary = set()
-
-  # Internal DFS visitor function
-  stack = []
-
-  def visit(rootNode):
-    stack.append(rootNode)
-
-    while len(stack) != 0:
-      node = stack.pop()
-      if node in permanent:
-        continue
-      if node in temporary:
-        temporary.remove(node)
-        permanent.add(node)
-        order.append(node)
-      else:
-        stack.append(node)
-        temporary.add(node)
-        
-        # Visit A before B, purely for legibility
-        for parent in reversed(node.parents): 
-          stack.append(parent)
-
-  visit(node)
+  if node.order_version == graph_version:
+    return node.order
+  mark = next(searches)
+  reached = [node]
+  node.mark = mark
+  for n in reached: # Grows as we go
+    for parent in n.parents:
+      if parent.mark != mark:
+        parent.mark = mark
+        reached.append(parent)
+
+  # Place nodes directly by creation number when they were created close
+  # together (the common case), and fall back to sorting otherwise.
+  lowest = min(n.serial for n in reached)
+  span = node.serial - lowest + 1
+  if span <= 4 * len(reached):
+    slots = [None] * span
+    for n in reached:
+      slots[n.serial - lowest] = n
+    order = [ n for n in slots if n is not None ]
+  else:
+    order = sorted(reached, key = attrgetter("serial"))
   # In reverse mode, we want to compute in exactly the reverse order, 
   # to traverse the graph from the root node up towards the variables.
-  return list(reversed(order))
+  order.reverse()
+
+  node.order = order
+  node.order_version = graph_version
+  return order
+
+# Tensors: a Variable may hold a NumPy array, and a single node then covers a
+# whole array operation (see MatMul, Sum and Dot below) rather than one scalar
+# Mul or Add per element. Every adjoint has the shape of its node's value.
+def shape(value):
+  return getattr(value, "shape", ()) # Plain floats have no shape
+
+def ndim(value):
+  return getattr(value, "ndim", 0)
+
+# Sum an adjoint back down to the shape of the operand that was broadcast into it.
+def unbroadcast(adjoint, value):
+  target = shape(value)
+  if shape(adjoint) == target:
+    return adjoint
+  extra = ndim(adjoint) - len(target)
+  axes = tuple(range(extra)) + tuple(extra + i for (i, n) in enumerate(target) if n == 1)
+  return np.sum(adjoint, axis = axes).reshape(target)
 
 class Diff(): 
+  # Let our overloads win over NumPy's when an array meets a node (e.g. `array * x`).
+  __array_ufunc__ = None
+  commutative = False
+  broadcasts = False
+  mark = 0
+  order_version = -1
+
+  def __new__(cls, *args, **kwargs):
+    node = super().__new__(cls)
+    node.serial = next(creation)
+    return node
+
   def __add__(self, b):
-    return Add(self, lift(b))
+    return make(Add, self, lift(b))
   
   def __radd__(self, b): 
-    return Add(lift(b), self)
+    return make(Add, lift(b), self)
 
   def __sub__(self, b):
-    return Sub(self, lift(b))
+    return make(Sub, self, lift(b))
+
+  def __rsub__(self, b):
+    return make(Sub, lift(b), self)
   
   def __mul__(self, b):
-    return Mul(self, lift(b))
+    return make(Mul, self, lift(b))
+
+  def __rmul__(self, b):
+    return make(Mul, lift(b), self)
   
   def __truediv__(self, b):
-    return Div(self, lift(b))
-  
+    return make(Div, self, lift(b))
+
+  def __rtruediv__(self, b):
+    return make(Div, lift(b), self)
+
+  def __matmul__(self, b):
+    return make(MatMul, self, lift(b))
+
+  def __rmatmul__(self, b):
+    return make(MatMul, lift(b), self)
+
+  def sum(self):
+    return make(Sum, self)
+
+  def dot(self, b):
+    return make(Dot, self, lift(b))
+
+  # Hand adjoint contributions DA and DB to parents that were broadcast against each other.
+  def accumulate(self, da, db):
+    a,b = self.parents
+    a.adjoint += unbroadcast(da, a.value)
+    b.adjoint += unbroadcast(db, b.value)
+
+# Elementwise binary ops remember whether their operands broadcast, so that the
+# common all-scalar case can skip the extra work. A plain float result can only
+# come from two scalars, which spares us looking at shapes at all.
+def elementwise(node, a, b):
+  node.parents = [a, b]
+  if type(node.value) is not float and shape(a.value) != shape(b.value):
+    node.broadcasts = True
 
 class Constant(Diff):
   def __init__(self, value: float): 
@@ -80,35 +202,45 @@ class Variable(Diff):
     pass
     
 class Add(Diff): 
+  commutative = True
+
   def __init__(self, a: Diff, b: Diff):
     self.value = a.value + b.value
     self.adjoint = 0.0
-    self.parents = [a, b]
+    elementwise(self, a, b)
 
   def d(self): 
+    if self.broadcasts:
+      return self.accumulate(self.adjoint, self.adjoint)
     a,b = self.parents
     a.adjoint += self.adjoint 
     b.adjoint += self.adjoint
 
 class Sub(Diff): 
   def __init__(self, a: Diff, b: Diff):
-    self.value = a.value - b.value   
+    self.value = a.value - b.value
     self.adjoint = 0.0
-    self.parents = [a, b]
+    elementwise(self, a, b)
 
   def d(self): 
+    if self.broadcasts:
+      return self.accumulate(self.adjoint, -self.adjoint)
     a,b = self.parents
     a.adjoint += self.adjoint
     b.adjoint -= self.adjoint
 
 class Mul(Diff):
+  commutative = True
+
   def __init__(self, a: Diff, b: Diff):
     self.value = a.value * b.value
     self.adjoint = 0.0
-    self.parents = [a, b]
+    elementwise(self, a, b)
 
   def d(self): 
     a,b = self.parents 
+    if self.broadcasts:
+      return self.accumulate(self.adjoint * b.value, a.value * self.adjoint)
     a.adjoint += self.adjoint * b.value
     b.adjoint += a.value * self.adjoint
 
@@ -116,25 +248,143 @@ class Div(Diff):
   def __init__(self, a: Diff, b: Diff):
     self.value = a.value / b.value
     self.adjoint = 0.0
-    self.parents = [a, b]
+    elementwise(self, a, b)
 
   def d(self): 
     a,b = self.parents
     denominator = b.value * b.value
+    if self.broadcasts:
+      return self.accumulate(b.value * self.adjoint / denominator, -(a.value * self.adjoint / denominator))
     a.adjoint += b.value * self.adjoint / denominator
     b.adjoint += -(a.value * self.adjoint / denominator)
 
+# Matrix products of vectors and matrices, as with `@` on NumPy arrays.
+class MatMul(Diff):
+  def __init__(self, a: Diff, b: Diff):
+    if not (1 <= ndim(a.value) <= 2 and 1 <= ndim(b.value) <= 2):
+      raise ValueError("MatMul takes vectors and matrices")
+    self.value = a.value @ b.value
+    self.adjoint = 0.0
+    self.parents = [a, b]
+
+  def d(self):
+    a,b = self.parents
+    # Treat a vector on the left as a row and one on the right as a column,
+    # so that both adjoints are plain matrix products
+    A = a.value if ndim(a.value) == 2 else a.value[np.newaxis, :]
+    B = b.value if ndim(b.value) == 2 else b.value[:, np.newaxis]
+    G = np.reshape(self.adjoint, (A.shape[0], B.shape[1]))
+    a.adjoint += (G @ B.T).reshape(shape(a.value))
+    b.adjoint += (A.T @ G).reshape(shape(b.value))
+
+# Fused reductions: rather than a left-deep chain of binary Adds (and Muls), one
+# node covers a whole sum over N terms, with one derivative rule looping over all
+# of them. Every term is reduced to the sum of its elements, so a single array
+# parent gives the sum of an array, and N scalar parents their plain sum.
+def reduce_sum(values):
+  total = 0.0
+  for value in values:
+    total = total + (value if ndim(value) == 0 else np.sum(value))
+  return total
+
+# sum(x * y) for two values of the same shape.
+def inner(x, y):
+  return x * y if ndim(x) == 0 else np.vdot(x, y)
+
+# The sum of all elements of every term.
+class Sum(Diff):
+  commutative = True
+
+  def __init__(self, *terms: Diff):
+    self.value = reduce_sum(term.value for term in terms)
+    self.adjoint = 0.0
+    self.parents = list(terms)
+
+  def d(self):
+    for term in self.parents:
+      if ndim(term.value) == 0:
+        term.adjoint += self.adjoint
+      else:
+        term.adjoint += np.broadcast_to(self.adjoint, shape(term.value))
+
+# The sum of the squares of all elements of every term.
+class SumOfSquares(Diff):
+  commutative = True
+
+  def __init__(self, *terms: Diff):
+    self.value = reduce_sum(inner(term.value, term.value) for term in terms)
+    self.adjoint = 0.0
+    self.parents = list(terms)
+
+  def d(self):
+    twice = 2 * self.adjoint
+    for term in self.parents:
+      term.adjoint += twice * term.value
+
+# Inner products summed over pairs: Dot(a_1, ..., a_n, b_1, ..., b_n) is the sum
+# of sum(a_i * b_i), each pair of arrays having the same shape.
+class Dot(Diff):
+  commutative = True
+
+  def __init__(self, *terms: Diff):
+    if len(terms) % 2 != 0:
+      raise ValueError("Dot takes as many left as right operands")
+    half = len(terms) // 2
+    for (a, b) in zip(terms[:half], terms[half:]):
+      if shape(a.value) != shape(b.value):
+        raise ValueError(f"Dot of arrays with different shapes {shape(a.value)} and {shape(b.value)}")
+    self.parents = list(terms)
+    self.value = reduce_sum(inner(a.value, b.value) for (a, b) in self.pairs())
+    self.adjoint = 0.0
+
+  def pairs(self):
+    half = len(self.parents) // 2
+    return zip(self.parents[:half], self.parents[half:])
+
+  def d(self):
+    for (a, b) in self.pairs():
+      a.adjoint += self.adjoint * b.value
+      b.adjoint += self.adjoint * a.value
+
+# Builders for the fused reductions over sequences of terms (nodes or numbers).
+def sum_of(terms):
+  return make(Sum, *(lift(term) for term in terms))
+
+def sum_of_squares(terms):
+  return make(SumOfSquares, *(lift(term) for term in terms))
+
+def dot(a, b):
+  if len(a) != len(b):
+    raise ValueError(f"dot of sequences of different lengths {len(a)} and {len(b)}")
+  return make(Dot, *(lift(term) for term in a), *(lift(term) for term in b))
+
 # Compute the gradient [dResult / dInput_0 , ... dResult / dInput_n ]
+# Inputs may be arrays, and then get an array of the same shape; for an
+# array-valued result this is the gradient of the sum of its elements.
 def reverse_gradient(result_node, *inputs): 
   order = order_nodes(result_node)
+  for node in inputs: # Inputs the result does not depend on are not in the order
+    node.adjoint = 0.0
   for node in order:
     node.adjoint = 0.0
-  result_node.adjoint = 1.0
+  result_node.adjoint = np.ones(shape(result_node.value)) if ndim(result_node.value) else 1.0
   for node in order: 
     node.d()
   gradient = [ v.adjoint for v in inputs ]
   return gradient
 
+# Batched ("vmap"-style) evaluation: each row of POINTS is one set of inputs.
+# Values and adjoints simply become arrays with a leading batch dimension, so a
+# single graph and a single reverse sweep cover the whole batch.
+def batch_value_and_grad(f, points): 
+  points = np.asarray(points, dtype=float)
+  inputs = [ Variable(f"x_{i}", points[:, i]) for i in range(points.shape[1]) ]
+  result_node = lift(f(*inputs))
+  gradient = reverse_gradient(result_node, *inputs)
+  shape = points.shape[:1]
+  values = np.broadcast_to(result_node.value, shape)
+  return values, np.stack([ np.broadcast_to(g, shape) for g in gradient ], axis=-1)
+
 # "Lift" the function F to a new function that takes the same arguments and returns the gradient.
 def grad(f): 
   def g(*inputs): 
@@ -160,5 +410,20 @@ def main():
   gradF = grad(foo)
   print("∇F:", gradF(x, y))
 
+  # One sweep over a whole batch of (x, y) points
+  values, gradients = batch_value_and_grad(foo, [[5, 3], [1, 1], [0, 2]])
+  print("batch values:", values)
+  print("batch ∇F:", gradients.tolist())
+
+  # Least squares with one node per matrix operation, rather than one per multiply
+  A = Variable("A", np.arange(6.0).reshape(2, 3))
+  x = Variable("x", np.array([1.0, -1.0, 2.0]))
+  r = A @ x - np.array([1.0, 2.0])
+  loss = r.dot(r)
+  print("loss:", loss.value)
+  dA, dx = reverse_gradient(loss, A, x)
+  print("∂loss/∂A:", dA.tolist())
+  print("∂loss/∂x:", dx.tolist())
+
 if __name__ == "__main__":
   main()
\ No newline at end of file
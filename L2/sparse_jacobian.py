@@ -0,0 +1,143 @@
+# Sparse Jacobians via graph coloring
+#
+# For a vector-valued function (like a set of constraints), each output usually
+# touches only a few of the inputs. Two inputs that never appear in the same
+# output are "structurally orthogonal": we can seed both in the same forward
+# sweep and still tell their contributions apart, since each output only sees
+# one of them. Coloring the inputs so that no output sees two of the same color
+# gives a compressed Jacobian with one column per color. The same trick works
+# on outputs that share no input, seeded together in a reverse sweep.
+import numpy as np
+from scipy import sparse
+import forward
+import reverse
+
+# Combined order of the nodes every output depends on (parents first): one search
+# from all of the outputs at once, then by creation number, as in order_nodes.
+def combined_order(outputs):
+  nodes = {}
+  pending = list(outputs)
+  while pending:
+    node = pending.pop()
+    if node.serial not in nodes:
+      nodes[node.serial] = node
+      pending.extend(node.parents)
+  return [ nodes[serial] for serial in sorted(nodes) ]
+
+# Which inputs each output depends on: propagate one bit per input down the graph.
+def sparsity(order, inputs, outputs):
+  bits = { input: 1 << j for (j, input) in enumerate(inputs) }
+  depends = {}
+  for node in order:
+    mask = bits.get(node, 0)
+    for parent in node.parents:
+      mask |= depends[parent]
+    depends[node] = mask
+  pattern = []
+  for output in outputs:
+    mask, row = depends[output], []
+    while mask:
+      lowest = mask & -mask
+      row.append(lowest.bit_length() - 1)
+      mask ^= lowest
+    pattern.append(row)
+  return pattern
+
+# Greedy coloring of the "columns" of a pattern given as the columns in each row:
+# columns sharing a row get different colors. Most-connected columns go first.
+def color(rows, n_columns):
+  rows_of = [ [] for _ in range(n_columns) ]
+  for (i, row) in enumerate(rows):
+    for j in row:
+      rows_of[j].append(i)
+  colors = [ -1 ] * n_columns
+  for j in sorted(range(n_columns), key = lambda j: -len(rows_of[j])):
+    taken = { colors[k] for i in rows_of[j] for k in rows[i] }
+    c = 0
+    while c in taken:
+      c += 1
+    colors[j] = c
+  return colors
+
+def transpose(rows, n_columns):
+  columns = [ [] for _ in range(n_columns) ]
+  for (i, row) in enumerate(rows):
+    for j in row:
+      columns[j].append(i)
+  return columns
+
+def trace(engine, f, x):
+  inputs = [ engine.Variable(f"x_{i}", float(v)) for (i, v) in enumerate(x) ]
+  outputs = [ engine.lift(output) for output in f(inputs) ]
+  return inputs, outputs, combined_order(outputs)
+
+# One forward sweep, each input seeded with the one-hot vector of its color.
+def forward_compressed(order, inputs, outputs, pattern, colors):
+  n_colors = max(colors, default = -1) + 1
+  identity = np.eye(n_colors)
+  for (j, input) in enumerate(inputs):
+    input.set_partial(identity[colors[j]])
+  for node in order:
+    node.forward()
+  entries = []
+  for (i, output) in enumerate(outputs):
+    compressed = np.broadcast_to(output.partial, (n_colors,))
+    entries.extend((i, j, compressed[colors[j]]) for j in pattern[i])
+  return entries, n_colors
+
+# One reverse sweep, each output seeded with the one-hot vector of its color.
+def reverse_compressed(order, inputs, outputs, pattern, colors):
+  n_colors = max(colors, default = -1) + 1
+  identity = np.eye(n_colors)
+  for node in order:
+    node.adjoint = 0.0
+  for (i, output) in enumerate(outputs):
+    output.adjoint = output.adjoint + identity[colors[i]]
+  for node in reversed(order):
+    node.d()
+  entries = []
+  for (i, row) in enumerate(pattern):
+    for j in row:
+      compressed = np.broadcast_to(inputs[j].adjoint, (n_colors,))
+      entries.append((i, j, compressed[colors[i]]))
+  return entries, n_colors
+
+# "Lift" a vector-valued F (a list of parameters -> a list of outputs) to a function
+# returning its Jacobian as a scipy.sparse matrix. Forward mode colors the inputs,
+# reverse mode the outputs, and "auto" uses whichever needs fewer colors.
+def jacobian(f, mode="auto"):
+  def J(x):
+    inputs, outputs, order = trace(forward, f, x)
+    pattern = sparsity(order, inputs, outputs)
+    column_colors = color(pattern, len(inputs))
+    row_colors = color(transpose(pattern, len(inputs)), len(outputs))
+    use_reverse = mode == "reverse" or (mode == "auto" and max(row_colors, default = -1) < max(column_colors, default = -1))
+    if use_reverse:
+      inputs, outputs, order = trace(reverse, f, x)
+      entries, sweeps = reverse_compressed(order, inputs, outputs, pattern, row_colors)
+    else:
+      entries, sweeps = forward_compressed(order, inputs, outputs, pattern, column_colors)
+    J.sweeps = sweeps # Width of the compressed seed, for the curious
+    rows, columns, values = zip(*entries) if entries else ((), (), ())
+    return sparse.csr_matrix((values, (rows, columns)), shape = (len(outputs), len(inputs)))
+  return J
+
+def main():
+  # A chain of constraints, each touching only two neighboring parameters
+  def constraints(args):
+    return [ args[i] * args[i + 1] - 1 for i in range(len(args) - 1) ] + [ args[0] / args[-1] ]
+
+  x = [ 1.0 + 0.01 * i for i in range(200) ]
+  for mode in ["forward", "reverse", "auto"]:
+    J = jacobian(constraints, mode)
+    matrix = J(x)
+    print(f"{mode}: {matrix.shape[0]}x{matrix.shape[1]}, {matrix.nnz} nonzeros, {J.sweeps} seed columns")
+
+  # Check against one reverse sweep per row
+  matrix = jacobian(constraints)(x).toarray()
+  inputs = [ reverse.Variable(f"x_{i}", v) for (i, v) in enumerate(x) ]
+  dense = np.array([ reverse.reverse_gradient(reverse.lift(c), *inputs) for c in constraints(inputs) ])
+  print("max error vs. dense:", np.abs(matrix - dense).max())
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,200 @@
+# Reverse mode Autodiff on a tape (a "Wengert list")
+#
+# Instead of keeping every intermediate alive as a Python object with its own
+# `value`, `adjoint` and `parents` list, each operation appends one entry to a
+# handful of compact typed arrays. Entries are appended in creation order, and
+# since a node is always created after its parents the tape already is a
+# topological order: the backward pass is a reverse linear scan, with no DFS.
+from array import array
+
+# Opcodes
+CONSTANT, VARIABLE, ADD, SUB, MUL, DIV = range(6)
+
+class Tape():
+  def __init__(self):
+    self.ops = array('b')    # Opcode of each entry
+    self.lhs = array('i')    # Index of the first parent (-1 for leaves)
+    self.rhs = array('i')    # Index of the second parent (-1 for leaves)
+    self.values = array('d') # Value of each entry
+
+  def __len__(self):
+    return len(self.ops)
+
+  def push(self, op, a, b, value):
+    self.ops.append(op)
+    self.lhs.append(a)
+    self.rhs.append(b)
+    self.values.append(value)
+    return len(self.ops) - 1
+
+  # Drop every entry; handles into this tape must not be used afterwards.
+  def reset(self):
+    del self.ops[:]
+    del self.lhs[:]
+    del self.rhs[:]
+    del self.values[:]
+
+  # Make this the tape new nodes are recorded on, for the duration of a `with` block.
+  def __enter__(self):
+    global current_tape
+    self.previous = current_tape
+    current_tape = self
+    return self
+
+  def __exit__(self, *exc):
+    global current_tape
+    current_tape = self.previous
+
+# Nodes built outside of any `with Tape():` block go here, and stay for as long as
+# the process runs: record long-running loops of computations on tapes of their own.
+# `grad` does this for every call.
+current_tape = Tape()
+
+def lift(value):
+  if isinstance(value, Diff):
+    return value # Already a node
+  else:
+    return Constant(value) # Make constant
+
+# Nodes are only handles: a tape and an index into it.
+class Diff():
+  __slots__ = ("tape", "index")
+
+  @property
+  def value(self):
+    return self.tape.values[self.index]
+
+  def __add__(self, b):
+    return record(ADD, self, lift(b))
+
+  def __radd__(self, b):
+    return record(ADD, lift(b), self)
+
+  def __sub__(self, b):
+    return record(SUB, self, lift(b))
+
+  def __rsub__(self, b):
+    return record(SUB, lift(b), self)
+
+  def __mul__(self, b):
+    return record(MUL, self, lift(b))
+
+  def __rmul__(self, b):
+    return record(MUL, lift(b), self)
+
+  def __truediv__(self, b):
+    return record(DIV, self, lift(b))
+
+  def __rtruediv__(self, b):
+    return record(DIV, lift(b), self)
+
+def handle(tape, index):
+  node = Diff.__new__(Diff)
+  node.tape = tape
+  node.index = index
+  return node
+
+def record(op, a, b):
+  tape = a.tape
+  if b.tape is not tape:
+    raise ValueError("cannot combine nodes recorded on different tapes")
+  values = tape.values
+  x, y = values[a.index], values[b.index]
+  if op == ADD:
+    value = x + y
+  elif op == SUB:
+    value = x - y
+  elif op == MUL:
+    value = x * y
+  else:
+    value = x / y
+  return handle(tape, tape.push(op, a.index, b.index, value))
+
+class Constant(Diff):
+  __slots__ = ()
+
+  def __init__(self, value: float):
+    self.tape = current_tape
+    self.index = current_tape.push(CONSTANT, -1, -1, value)
+
+class Variable(Diff):
+  __slots__ = ("name",)
+
+  def __init__(self, name: str, value: float):
+    self.name = name
+    self.tape = current_tape
+    self.index = current_tape.push(VARIABLE, -1, -1, value)
+
+# Compute the gradient [dResult / dInput_0 , ... dResult / dInput_n ]
+# Only the entries from the first input up to the result can contribute to it:
+# anything recorded before every input depends on none of them, so the scan (and
+# the adjoints, offset by `start`) skip the rest of a long shared tape.
+def reverse_gradient(result_node, *inputs):
+  tape = result_node.tape
+  ops, lhs, rhs, values = tape.ops, tape.lhs, tape.rhs, tape.values
+  n = result_node.index + 1
+  start = min((v.index for v in inputs if v.tape is tape and v.index < n), default = n - 1)
+  adjoint = array('d', bytes(8 * (n - start)))
+  adjoint[n - 1 - start] = 1.0
+  for i in range(n - 1, start - 1, -1):
+    op = ops[i]
+    if op < ADD:
+      continue # Leaves have nothing to propagate
+    g = adjoint[i - start]
+    if g == 0.0:
+      continue # Not (yet) reachable from the result
+    a, b = lhs[i] - start, rhs[i] - start # Negative: before every input, no adjoint needed
+    if op == ADD:
+      da, db = g, g
+    elif op == SUB:
+      da, db = g, -g
+    elif op == MUL:
+      da, db = g * values[b + start], values[a + start] * g
+    else:
+      denominator = values[b + start] * values[b + start]
+      da, db = values[b + start] * g / denominator, -(values[a + start] * g / denominator)
+    if a >= 0:
+      adjoint[a] += da
+    if b >= 0:
+      adjoint[b] += db
+  return [ adjoint[v.index - start] if v.tape is tape and start <= v.index < n else 0.0 for v in inputs ]
+
+# "Lift" the function F to a new function that takes the same arguments and returns the gradient.
+# Every call records on a fresh tape, dropped once the gradient is taken, with the
+# inputs (nodes or numbers) re-created on it as Variables holding their values.
+def grad(f):
+  def g(*inputs):
+    with Tape():
+      variables = [ Variable(getattr(x, "name", f"x_{i}"), x.value if isinstance(x, Diff) else x) for (i, x) in enumerate(inputs) ]
+      result_node = lift(f(*variables))
+      return reverse_gradient(result_node, *variables)
+  return g
+
+# Our function
+def foo(x, y):
+  return (x * x) + (y - x) + 2
+
+def main():
+  x = Variable("x", 5)
+  y = Variable("y", 3)
+
+  # z = x^2 + (y-x) + 2
+  z = foo(x, y)
+  print("result.value:", z.value)
+  print("tape length:", len(z.tape))
+
+  print("reverse(z):", reverse_gradient(z, x, y))
+
+  gradF = grad(foo)
+  print("∇F:", gradF(x, y))
+
+  # Long computations stay compact: a few bytes per entry rather than one object each.
+  with Tape() as tape:
+    x = Variable("x", 1.0001)
+    total = x
+    for _ in range(100000):
+      total = total * x
+    print("long chain:", len(tape), "entries, d/dx =", reverse_gradient(total, x))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,90 @@
+# Trace once, replay many times
+#
+# Calling an objective on fresh Variables rebuilds the whole graph, even though
+# in an optimization loop its structure is identical at every step: only the
+# values of the inputs change. Instead we trace the function once, keep the
+# graph and its topological order, and re-propagate values through it.
+#
+# Caveat: control flow is frozen at the traced point. A function that branches
+# on the value of its inputs (`if x.value > 0: ...`) will keep following the
+# branch taken during tracing.
+import numpy as np
+import passes
+from collections import Counter
+from hessian import hvp_sweep
+from forward import Variable, lift, order_nodes, vector_sweep
+
+class Compiled():
+  def __init__(self, f, n_inputs: int, simplify: bool = False, fuse: bool = True):
+    self.f = f
+    self.n_inputs = n_inputs
+    self.simplify = simplify
+    self.fuse = fuse
+    self.stats = None
+    self.evaluations = Counter() # How many values, gradients and H·v we were asked for
+    self.result = None # Traced lazily, at the first point we are called with
+
+  def trace(self, x):
+    self.inputs = [ Variable(f"x_{i}", float(v)) for (i, v) in enumerate(x) ]
+    self.result = lift(self.f(self.inputs))
+    if self.simplify:
+      # Fold constants, share subexpressions and flatten sums before we ever sweep the graph
+      self.result, self.stats = passes.optimize(self.result, self.fuse)
+    self.order = order_nodes(self.result)
+    # Leaves never change once traced (or are set directly), so skip them when replaying.
+    self.operations = [ node for node in self.order if len(node.parents) != 0 ]
+
+  def set_inputs(self, x):
+    if len(x) != self.n_inputs:
+      raise ValueError(f"expected {self.n_inputs} inputs, got {len(x)}")
+    if self.result is None:
+      self.trace(x)
+      return
+    for (variable, v) in zip(self.inputs, x):
+      variable.value = float(v)
+    for node in self.operations:
+      node.evaluate()
+
+  def eval(self, x):
+    self.evaluations["value"] += 1
+    self.set_inputs(x)
+    return float(self.result.value)
+
+  def value_and_grad(self, x):
+    self.evaluations["value_and_grad"] += 1
+    self.set_inputs(x)
+    gradient = vector_sweep(self.order, self.result, self.inputs)
+    return float(self.result.value), gradient
+
+  def grad(self, x):
+    return self.value_and_grad(x)[1]
+
+  # Hessian-vector product H(x)·v on the traced graph (also SciPy's `hessp`)
+  def hvp(self, x, v):
+    self.evaluations["hvp"] += 1
+    self.set_inputs(x)
+    _, product = hvp_sweep(self.order, self.result, self.inputs, v)
+    return np.array(product, dtype = float)
+
+  __call__ = eval
+
+# Compile F, a function of a list of `n_inputs` parameters, into a replayable objective.
+# With `simplify`, the traced graph is run through passes.optimize first.
+def compile(f, n_inputs: int, simplify: bool = False, fuse: bool = True):
+  return Compiled(f, n_inputs, simplify, fuse)
+
+def main():
+  from objectives import linear_regression
+
+  objective = compile(linear_regression, 3)
+  print("f(1, 1, 0):", objective.eval([1, 1, 0]))
+  print("f(2, 1, 0):", objective.eval([2, 1, 0]))
+  print("value_and_grad(2, 1, 0):", objective.value_and_grad([2, 1, 0]))
+  print("nodes replayed per call:", len(objective.operations))
+
+  simplified = compile(linear_regression, 3, simplify = True)
+  print("simplified value_and_grad(2, 1, 0):", simplified.value_and_grad([2, 1, 0]))
+  print("simplified nodes replayed per call:", len(simplified.operations), dict(simplified.stats))
+
+if __name__ == "__main__":
+  main()